@@ -1,8 +1,12 @@
 from pathlib import Path
 import tkinter as tk
-from tkinter import Tk, Canvas, Entry, Button, PhotoImage, END
+from tkinter import Tk, Canvas, Entry, Button, PhotoImage, Scrollbar, END
 from tkinter.scrolledtext import ScrolledText
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageTk
 import types
+import io
 import os
 import threading
 import sys
@@ -12,6 +16,8 @@ from multiprocessing import freeze_support
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "logic"))
 import blur_sorter as blur
 import detection as detect
+from score_table import ScoreTable, RATED
+import thumbnails
 
 if getattr(sys, 'frozen', False):
     BASE_PATH = Path(sys._MEIPASS)
@@ -20,6 +26,16 @@ else:
 
 ASSETS_PATH = BASE_PATH / "assets" / "frame0"
 
+# Review grid: three thumbnails per side, kept on the left and rejected on the right
+REVIEW_THUMB = 108
+REVIEW_CELL_WIDTH = 116
+REVIEW_CELL_HEIGHT = 134
+REVIEW_HEADER_HEIGHT = 26
+REVIEW_COLUMNS = 3
+REVIEW_SPLIT = 352
+
+TOLERANCE_SLIDER_RANGE = (-100, 100)  # typed values outside this still work, the slider just stops at its end
+
 def relative_to_assets(path: str) -> Path:
     return ASSETS_PATH / Path(path)
 
@@ -51,15 +67,30 @@ class MainApp:
         self.burst_enabled = True
         self.img_detect_enabled = True
         self.star_enabled = False
+        self.subject_enabled = False
         self.sharpness_level = 0
         self.detection_mode = "accurate"
         self.solo_detection = False
+        self.score_table = None
+
+        # Thumbnails are made off the UI thread, only the visible ones are kept as PhotoImages
+        self.thumbnail_cache = thumbnails.ThumbnailCache(size=REVIEW_THUMB)
+        self.thumbnail_pool = ThreadPoolExecutor(max_workers=4)
+        self.thumbnail_pending = set()
+        self.thumbnail_failed = set()
+        self.review_photos = {}
+        self.review_visible = set()
+        self.review_rows = []
+        self.review_tops = []
+        self.review_redraw_queued = False
 
         self.home_frame = tk.Frame(self.root, bg="white")
         self.settings_frame = tk.Frame(self.root, bg="black")        
+        self.review_frame = tk.Frame(self.root, bg="black")
 
         self.setup_homescreen()
         self.setup_settings()
+        self.setup_review()
         self.show_home()
 
     # ===============================
@@ -67,12 +98,17 @@ class MainApp:
     # ===============================
     def show_home(self):
         self.settings_frame.place_forget()
+        self.review_frame.place_forget()
         self.home_frame.place(x=0, y=0, width=720, height=480)
 
     def show_settings(self):
         self.home_frame.place_forget()
         self.settings_frame.place(x=0, y=0, width=720, height=480)
 
+    def show_review(self):
+        self.home_frame.place_forget()
+        self.review_frame.place(x=0, y=0, width=720, height=480)
+
     def back_clicked(self):
         self.canvas.itemconfig(self.processing_text, text="")    
         self.show_home()
@@ -117,6 +153,11 @@ class MainApp:
         self.settings_button.image = settings_image
         self.settings_button.place(x=232.0, y=115.0, width=118.0, height=40.0)
 
+        self.review_button = Button(self.home_frame, text="Review", font=("Inter", 14), borderwidth=0,
+                                    highlightthickness=0, command=self.review_clicked, bg="#1E1E1E", fg="#D9D9D9",
+                                    activebackground="#555555", activeforeground="#FFFFFF", relief="flat")
+        self.review_button.place(x=22.0, y=260.0, width=100.0, height=40.0)
+
         self.processing_text = self.canvas.create_text(22.0, 165.0, anchor="nw", text="", fill="#D9D9D9", font=("Inter", 26))
         self.error_text_1 = self.canvas.create_text(22.0, 200.0, anchor="nw", text="", fill="#D9D9D9", font=("Inter", 22))
         self.error_text_2 = self.canvas.create_text(22.0, 222.0, anchor="nw", text="", fill="#D9D9D9", font=("Inter", 22))
@@ -166,9 +207,9 @@ class MainApp:
         self.settings_canvas.create_text(label_x, start_y + row_height * 4, anchor="nw", text="Sort by Rating:", fill="#D9D9D9", font=("Inter", 18))
         self.settings_canvas.create_text(label_x, start_y + row_height * 5, anchor="nw", text="Image Detection:", fill="#D9D9D9", font=("Inter", 18))
         self.settings_canvas.create_text(label_x, start_y + row_height * 6, anchor="nw", text="Detection Mode:", fill="#D9D9D9", font=("Inter", 18))
-        self.settings_canvas.create_text(label_x, start_y + row_height * 7, anchor="nw", text="Feature 8:", fill="#666666", font=("Inter", 18))
-        self.settings_canvas.create_text(label_x, start_y + row_height * 8, anchor="nw", text="Feature 9:", fill="#666666", font=("Inter", 18))
-        self.settings_canvas.create_text(label_x, start_y + row_height * 9, anchor="nw", text="Feature 10:", fill="#666666", font=("Inter", 18))
+        self.settings_canvas.create_text(label_x, start_y + row_height * 7, anchor="nw", text="Subject Focus:", fill="#D9D9D9", font=("Inter", 18))
+        self.settings_canvas.create_text(label_x, start_y + row_height * 8, anchor="nw", text="Compensation Slider:", fill="#D9D9D9", font=("Inter", 18))
+        self.settings_canvas.create_text(label_x, start_y + row_height * 9, anchor="nw", text="Live Preview:", fill="#D9D9D9", font=("Inter", 18))
 
         # Load images
         self.low_image = PhotoImage(file=str(relative_to_assets("Low.png")))
@@ -237,9 +278,58 @@ class MainApp:
                                 command=self.fast_clicked, bg="#262827", relief="flat")
         self.fast_button.place(x=control_x + 65, y=start_y + row_height * 6 - 1, width=60, height=21)
 
+        # Row 8 Controls: Subject-aware sharpness toggle
+        self.subject_on = Button(self.settings_frame, image=self.off_image, borderwidth=0, highlightthickness=0,
+                                command=self.subject_clicked, bg="#262827", relief="flat")
+        self.subject_on.place(x=control_x, y=start_y + row_height * 7 - 1, width=60, height=21)
+
+        # Row 9 Controls: Slider for the threshold compensation, kept in sync with the entry
+        self.tolerance_slider = tk.Scale(self.settings_frame, from_=TOLERANCE_SLIDER_RANGE[0], to=TOLERANCE_SLIDER_RANGE[1],
+                                         orient="horizontal", showvalue=0,
+                                         command=self.slider_moved, bg="#262827", fg="#D9D9D9", troughcolor="#1E1E1E",
+                                         highlightthickness=0, borderwidth=0, sliderlength=20, width=12)
+        self.tolerance_slider.place(x=control_x, y=start_y + row_height * 8 + 3, width=250, height=16)
+        self.tolerance_comp.bind("<KeyRelease>", self.tolerance_typed)
+
+        # Row 10 Controls: What the current threshold would keep, re-judged from the last run's scores
+        self.preview_text = self.settings_canvas.create_text(control_x, start_y + row_height * 9, anchor="nw",
+                                                             text="Run once to preview.", fill="#D9D9D9", font=("Inter", 16))
+        self.apply_button = Button(self.settings_frame, text="Apply", font=("Inter", 12), borderwidth=0,
+                                   highlightthickness=0, command=self.apply_clicked, bg="#1E1E1E", fg="#D9D9D9",
+                                   activebackground="#555555", activeforeground="#FFFFFF", relief="flat")
+        self.apply_button.place(x=640, y=start_y + row_height * 9 - 1, width=60, height=21)
+        self.flips_text = self.settings_canvas.create_text(120, start_y + row_height * 10 - 2, anchor="nw", text="",
+                                                           fill="#D9D9D9", font=("Inter", 12), width=590)
+
         # Version text
         self.settings_canvas.create_text(8.0, 455.0, anchor="nw", text="Version 1.2.0", fill="#D9D9D9", font=("Inter ExtraLightItalic", 16))
 
+    def setup_review(self):
+        self.review_header = Canvas(self.review_frame, bg="#252827", height=44, width=720, bd=0, highlightthickness=0, relief="ridge")
+        self.review_header.place(x=0, y=0)
+
+        back_image = PhotoImage(file=relative_to_assets("Back.png"))
+        self.review_back_button = Button(self.review_frame, image=back_image, borderwidth=0, highlightthickness=0,
+                                         command=self.show_home, relief="flat")
+        self.review_back_button.image = back_image
+        self.review_back_button.place(x=8, y=2, width=100.0, height=40.0)
+
+        self.review_header.create_text(REVIEW_SPLIT // 2 + 60, 22, text="Kept", fill="#D9D9D9", font=("Inter", 18))
+        self.review_header.create_text(REVIEW_SPLIT + REVIEW_SPLIT // 2, 22, text="Rejected", fill="#D9D9D9", font=("Inter", 18))
+        self.review_summary = self.review_header.create_text(710, 22, anchor="e", text="", fill="#D9D9D9", font=("Inter", 12))
+
+        # Only the rows in view are drawn, the scroll region is the height of the whole grid
+        self.review_canvas = Canvas(self.review_frame, bg="#252827", bd=0, highlightthickness=0,
+                                    relief="ridge", yscrollincrement=REVIEW_HEADER_HEIGHT)
+        self.review_canvas.place(x=0, y=44, width=704, height=436)
+        self.review_scrollbar = Scrollbar(self.review_frame, orient="vertical", command=self.review_canvas.yview)
+        self.review_scrollbar.place(x=704, y=44, width=16, height=436)
+        self.review_canvas.configure(yscrollcommand=self.review_scrolled)
+
+        self.review_canvas.bind("<MouseWheel>", lambda e: self.review_canvas.yview_scroll(int(-e.delta / 40), "units"))
+        self.review_canvas.bind("<Button-4>", lambda e: self.review_canvas.yview_scroll(-3, "units"))
+        self.review_canvas.bind("<Button-5>", lambda e: self.review_canvas.yview_scroll(3, "units"))
+
     # ===============================
     # Toggle Settings
     # ===============================
@@ -255,6 +345,10 @@ class MainApp:
         self.star_enabled = not self.star_enabled
         self.star_on.config(image=self.on_image if self.star_enabled else self.off_image)
 
+    def subject_clicked(self):
+        self.subject_enabled = not self.subject_enabled
+        self.subject_on.config(image=self.on_image if self.subject_enabled else self.off_image)
+
     def img_detection_clicked(self):
         self.img_detect_enabled = not self.img_detect_enabled
         self.img_detection_on.config(image=self.on_image if self.img_detect_enabled else self.off_image)
@@ -268,6 +362,7 @@ class MainApp:
         }
         for val, (button, off, on) in buttons.items():
             button.config(image=on if val == level else off)
+        self.update_preview()
 
     def low_clicked(self):
         self.set_blur_level(-20)
@@ -278,6 +373,69 @@ class MainApp:
     def high_clicked(self):
         self.set_blur_level(30)
         
+    def slider_moved(self, value):
+        if self.current_tolerance() != int(value):
+            self.tolerance_comp.delete(0, END)
+            self.tolerance_comp.insert(0, str(value))
+        self.update_preview()
+
+    def tolerance_typed(self, event=None):
+        tolerance = self.current_tolerance()
+        # set() fires slider_moved, out of range it would clamp and overwrite what was typed
+        low, high = TOLERANCE_SLIDER_RANGE
+        if tolerance is not None and low <= tolerance <= high:
+            self.tolerance_slider.set(tolerance)
+        self.update_preview()
+
+    def current_tolerance(self):
+        text = self.tolerance_comp.get().strip()
+        if not text:
+            return 0
+        try:
+            return int(text)
+        except ValueError:
+            return None
+
+    # ===============================
+    # Live Threshold Preview
+    # ===============================
+    def update_preview(self):
+        # The sorter thread is still adding rows while processing
+        if self.score_table is None or not len(self.score_table) or self.is_processing:
+            return
+        tolerance = self.current_tolerance()
+        if tolerance is None:
+            self.settings_canvas.itemconfig(self.preview_text, text="Invalid compensation value.")
+            return
+
+        preview = self.score_table.preview(self.sharpness_level + tolerance)
+        added, removed = preview["added"], preview["removed"]
+        self.settings_canvas.itemconfig(
+            self.preview_text,
+            text=f"Keep {preview['kept']}/{preview['total']}  (+{len(added)} / -{len(removed)})"
+        )
+
+        # Closest to the threshold first, those are the ones worth a look
+        flips = []
+        if added:
+            flips.append("+ " + ", ".join(added[:4]) + (" ..." if len(added) > 4 else ""))
+        if removed:
+            flips.append("- " + ", ".join(removed[:4]) + (" ..." if len(removed) > 4 else ""))
+        self.settings_canvas.itemconfig(self.flips_text, text="\n".join(flips))
+
+    def apply_clicked(self):
+        if self.score_table is None or self.is_processing:
+            return
+        tolerance = self.current_tolerance()
+        if tolerance is None:
+            return
+        try:
+            result = self.score_table.commit(self.sharpness_level + tolerance)
+            print(f"Applied threshold: copied {len(result['copied'])}, removed {len(result['removed'])} from Sharp")
+        except OSError as e:
+            print(f"Error applying threshold: {e}")
+        self.update_preview()
+
     def fast_clicked(self):
         self.detection_mode = "fast"
         self.fast_button.config(image=self.fast_image_active)
@@ -334,6 +492,131 @@ class MainApp:
             progress_text = f"Detection: {current}/{total} images"
             self.root.after(0, lambda: self.canvas.itemconfig(self.processing_text, text=progress_text))
 
+    # ===============================
+    # Review Grid
+    # ===============================
+    def review_clicked(self):
+        if self.is_processing:
+            return
+        if self.score_table is None or not len(self.score_table):
+            self.canvas.itemconfig(self.processing_text, text="Run once to review.")
+            return
+        self.thumbnail_failed.clear()
+        self.review_photos.clear()
+        self.build_review_layout()
+        self.show_review()
+        self.review_canvas.yview_moveto(0)
+        self.queue_review_redraw()
+
+    def build_review_layout(self):
+        # One entry per grid row: (top, height, header text or (kept rows, rejected rows))
+        self.review_rows = []
+        y = 0
+        kept_total = rejected_total = 0
+        for key, kept, rejected in self.score_table.groups():
+            kept_total += len(kept)
+            rejected_total += len(rejected)
+            title = f"Burst {key}" if key else "Not in a burst"
+            self.review_rows.append((y, REVIEW_HEADER_HEIGHT, f"{title}  ({len(kept)} kept, {len(rejected)} rejected)"))
+            y += REVIEW_HEADER_HEIGHT
+            for i in range(0, max(len(kept), len(rejected)), REVIEW_COLUMNS):
+                cells = (kept[i:i + REVIEW_COLUMNS], rejected[i:i + REVIEW_COLUMNS])
+                self.review_rows.append((y, REVIEW_CELL_HEIGHT, cells))
+                y += REVIEW_CELL_HEIGHT
+
+        self.review_tops = [row[0] for row in self.review_rows]
+        self.review_canvas.configure(scrollregion=(0, 0, 704, y))
+        self.review_header.itemconfig(self.review_summary, text=f"{kept_total} kept / {rejected_total} rejected")
+
+    def review_scrolled(self, first, last):
+        self.review_scrollbar.set(first, last)
+        self.queue_review_redraw()
+
+    def queue_review_redraw(self):
+        # Scrolling fires many events per frame, draw once when Tk is idle
+        if not self.review_redraw_queued:
+            self.review_redraw_queued = True
+            self.root.after_idle(self.redraw_review)
+
+    def redraw_review(self):
+        self.review_redraw_queued = False
+        canvas = self.review_canvas
+        canvas.delete("row")
+        top = canvas.canvasy(0)
+        bottom = top + canvas.winfo_height()
+
+        # Filled while drawing, the thumbnail pool checks it before making each thumbnail
+        visible = self.review_visible = set()
+        index = max(0, bisect_right(self.review_tops, top) - 1)
+        while index < len(self.review_rows) and self.review_rows[index][0] < bottom:
+            y, height, content = self.review_rows[index]
+            if isinstance(content, str):
+                canvas.create_rectangle(0, y, 704, y + height, fill="#1E1E1E", outline="", tags="row")
+                canvas.create_text(10, y + height // 2, anchor="w", text=content, fill="#D9D9D9",
+                                   font=("Inter", 12), tags="row")
+            else:
+                canvas.create_line(REVIEW_SPLIT, y, REVIEW_SPLIT, y + height, fill="#555555", tags="row")
+                for side, rows in enumerate(content):
+                    x = side * REVIEW_SPLIT + 2
+                    for row in rows:
+                        visible.add(self.score_table.names[row])
+                        self.draw_review_cell(row, x, y)
+                        x += REVIEW_CELL_WIDTH
+            index += 1
+
+        # PhotoImages of rows that scrolled away are dropped, the thumbnail cache keeps their bytes
+        for name in list(self.review_photos):
+            if name not in visible:
+                del self.review_photos[name]
+
+    def draw_review_cell(self, row, x, y):
+        table = self.score_table
+        name = table.names[row]
+        center_x = x + REVIEW_CELL_WIDTH // 2
+        photo = self.review_photos.get(name)
+        if photo is not None:
+            self.review_canvas.create_image(center_x, y + 4 + REVIEW_THUMB // 2, image=photo, tags="row")
+        else:
+            self.review_canvas.create_rectangle(x + 4, y + 4, x + 4 + REVIEW_THUMB, y + 4 + REVIEW_THUMB,
+                                                fill="#1E1E1E", outline="", tags="row")
+            self.request_thumbnail(name)
+
+        # Rated images are kept without being scored, everything else shows its Laplacian score
+        score = "rated" if table.states[row] == RATED else f"{table.scores[row]:.0f}"
+        self.review_canvas.create_text(center_x, y + REVIEW_THUMB + 8, anchor="n", text=f"{name[:12]} {score}",
+                                       fill="#D9D9D9", font=("Inter", 9), tags="row")
+
+    def request_thumbnail(self, name):
+        if name in self.thumbnail_pending or name in self.thumbnail_failed:
+            return
+        self.thumbnail_pending.add(name)
+        self.thumbnail_pool.submit(self.load_thumbnail, name, os.path.join(self.score_table.folder, name))
+
+    def load_thumbnail(self, name, path):
+        # Runs on the thumbnail pool; rows scrolled past before their turn are skipped
+        if name not in self.review_visible:
+            self.root.after(0, self.thumbnail_ready, name, None, True)
+            return
+        try:
+            data = self.thumbnail_cache.get(path)
+        except Exception as e:
+            print(f"Thumbnail failed for {name}: {e}")
+            data = None
+        self.root.after(0, self.thumbnail_ready, name, data, False)
+
+    def thumbnail_ready(self, name, data, skipped):
+        self.thumbnail_pending.discard(name)
+        if data is None and not skipped:
+            self.thumbnail_failed.add(name)  # keeps its placeholder instead of being retried on every redraw
+            return
+        if name not in self.review_visible:
+            return
+        if data is None:
+            self.queue_review_redraw()  # skipped while the grid was being redrawn, ask again
+            return
+        self.review_photos[name] = ImageTk.PhotoImage(Image.open(io.BytesIO(data)))
+        self.queue_review_redraw()
+
     # ===============================
     # Sorter + Detection Logic
     # ===============================
@@ -366,7 +649,10 @@ class MainApp:
             "use_starcheck": self.star_enabled,
             "use_laplaciancheck": self.laplacian_enabled,
             "group_bursts": self.burst_enabled,
+            "subject_aware": self.subject_enabled,
+            "score_table": ScoreTable(folder),
         }
+        self.score_table = options["score_table"]
 
         # Set up output box and redirect stdout
         self.output_box.place(x=410, y=20, width=290, height=440)
@@ -433,6 +719,7 @@ class MainApp:
         self.is_processing = False
         self.canvas.itemconfig(self.processing_text, text="Process Complete.")
         self.button_1.lift()  # Show the start button again
+        self.update_preview()
 
     def run_sorter(self, options):
         try:
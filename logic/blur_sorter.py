@@ -1,27 +1,59 @@
 import os
 import cv2
 import time
-import shutil
 import multiprocessing
 from PIL import Image
 from PIL.ExifTags import TAGS
 from collections import defaultdict
+from sharding import in_shard, filter_names
+import scheduler
+import sharpness
+import ingest
+import raw_preview
+import decoders
+from score_table import ScoreTable, JUDGED, ALWAYS, NEVER, RATED
+
+EXIF_IFD = 0x8769
+IMAGE_EXTENSIONS = decoders.image_extensions()  # plus the RAW formats in raw_preview
 
 class EXIFHelper:
     @staticmethod
-    def get_exif_value(path, key, default=None):
-        try:
-            with Image.open(path) as img:
-                exif_data = img._getexif()
-                if not exif_data:
-                    return default
-                for tag_id, value in exif_data.items():
-                    tag = TAGS.get(tag_id, tag_id)
-                    if tag == key:
-                        return value
-        except Exception as e:
-            print(f"Error reading {key} from {path}: {e}")
-        return default
+    def read_tags(source):
+        # source is a path, the bytes of a file that was already read or an ingested file
+        if isinstance(source, ingest.Ingested):
+            blocks = source.exif_blocks()
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            blocks = [ingest.embedded_exif(source)]
+        elif raw_preview.is_raw(source):
+            preview, blocks = raw_preview.extract(ingest.read_head(source))
+            blocks = blocks + [ingest.exif_segment(preview)]
+        else:
+            blocks = [ingest.read_exif_block(source)]
+
+        tags = {}
+        for block in blocks:
+            if not block:
+                continue
+            try:
+                exif = Image.Exif()
+                exif.load(bytes(block))
+                block_tags = {TAGS.get(tag_id, tag_id): value for tag_id, value in exif.items()}
+                # Shooting settings live in the Exif sub-IFD, merged like Image._getexif() does
+                block_tags.update({TAGS.get(tag_id, tag_id): value for tag_id, value in exif.get_ifd(EXIF_IFD).items()})
+            except Exception as e:
+                name = os.path.basename(source) if isinstance(source, str) else "buffer"
+                print(f"Error reading EXIF from {name}: {e}")
+                continue
+            # Earlier blocks win, the preview's own Exif block is only a fallback
+            for key, value in block_tags.items():
+                tags.setdefault(key, value)
+        return tags
+
+    @staticmethod
+    def get_exif_value(source, key, default=None):
+        # source is a path or tags from read_tags
+        tags = source if isinstance(source, dict) else EXIFHelper.read_tags(source)
+        return tags.get(key, default)
 
     @staticmethod
     def get_fstop(path):
@@ -38,7 +70,12 @@ class EXIFHelper:
 
     @staticmethod
     def get_rating(path):
-        return EXIFHelper.get_exif_value(path, 'Rating', "0")
+        # Stars as an int, 0 (unrated) when missing or unreadable
+        value = EXIFHelper.get_exif_value(path, 'Rating', 0)
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return 0
 
     @staticmethod
     def get_datetime_original(path):
@@ -52,29 +89,37 @@ class EXIFHelper:
 class ImageAnalyzer:
     @staticmethod
     def crop_center(image, fraction=0.5):
-        h, w = image.shape[:2]
-        ch, cw = int(h * fraction), int(w * fraction)
-        y, x = (h - ch) // 2, (w - cw) // 2
-        return image[y:y+ch, x:x+cw]
+        return sharpness.crop_center(image, fraction)
 
     @staticmethod
-    def is_sharp(image, path, base_blur, tolerance):
-        cropped = ImageAnalyzer.crop_center(image)
-        laplacian = cv2.Laplacian(cropped, cv2.CV_64F).var()
+    def is_sharp(image, path, base_blur, tolerance, strategy="crop", grid=sharpness.DEFAULT_GRID, boxes=None,
+                 tags=None):
+        laplacian = sharpness.score(image, strategy, grid, boxes=boxes)
+        return ImageAnalyzer.judge(laplacian, path, base_blur, tolerance, tags)
 
-        fstop = EXIFHelper.get_fstop(path)
-        iso = EXIFHelper.get_iso(path)
-        shutter = EXIFHelper.get_shutter_speed(path)
+    @staticmethod
+    def base_threshold(source):
+        # Threshold from the shooting settings alone, base_blur and tolerance are added on top
+        fstop = EXIFHelper.get_fstop(source)
+        iso = EXIFHelper.get_iso(source)
+        shutter = EXIFHelper.get_shutter_speed(source)
 
         if fstop < 4 and iso < 2000:
-            threshold = 36
-        elif iso > 5000:
-            threshold = 410
-        elif iso > 2000 or (shutter and shutter <= 0.05):
-            threshold = 200
-        else:
-            threshold = 75
+            return 36
+        if iso > 5000:
+            return 410
+        if iso > 2000 or (shutter and shutter <= 0.05):
+            return 200
+        return 75
 
+    @staticmethod
+    def judge(laplacian, path, base_blur, tolerance, tags=None):
+        # Read the EXIF once, from the buffer the image was decoded from when we have it
+        source = tags if tags is not None else EXIFHelper.read_tags(path)
+        fstop = EXIFHelper.get_fstop(source)
+        iso = EXIFHelper.get_iso(source)
+
+        threshold = ImageAnalyzer.base_threshold(source)
         threshold += base_blur + tolerance
         
         # Debug output for first few images
@@ -85,33 +130,58 @@ class ImageAnalyzer:
         return laplacian > threshold, laplacian
 
 
-def compute_laplacian_variance(image_path):
-    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+def decode_for_scoring(item, detector=None):
+    # Returns the grayscale image and, with a detector, the subject boxes from the same decode
+    if detector is None:
+        return item.decode(gray=True), None
+    color = item.decode(gray=False)
+    if color is None:
+        return None, None
+    boxes = [box for _, box in detector.detect_boxes(color)]
+    return cv2.cvtColor(color, cv2.COLOR_BGR2GRAY), boxes
+
+
+def compute_laplacian_variance(image_path, strategy="crop", grid=sharpness.DEFAULT_GRID, boxes=None):
+    image = ingest.read(image_path).decode(gray=True)
     if image is None:
         return 0.0
-    cropped = ImageAnalyzer.crop_center(image)
-    return cv2.Laplacian(cropped, cv2.CV_64F).var()
+    return sharpness.score(image, strategy, grid, boxes=boxes)
 
 
-def find_burst_groups(folder):
+def find_burst_groups(folder, shard=None, captures=None):
+    if captures is None:
+        captures = ingest.list_captures(folder, IMAGE_EXTENSIONS)
     burst_groups = defaultdict(list)
-    for fname in os.listdir(folder):
-        if not fname.lower().endswith(".jpg"):
-            continue
+    for fname in captures:
         fpath = os.path.join(folder, fname)
-        dt = EXIFHelper.get_datetime_original(fpath)
-        sub = EXIFHelper.get_subsec_time(fpath)
+        # Only the Exif block is read here, the full file is read once when the burst is scored
+        tags = EXIFHelper.read_tags(fpath)
+        dt = EXIFHelper.get_datetime_original(tags)
+        sub = EXIFHelper.get_subsec_time(tags)
         if dt:
             key = dt  # Use only DateTimeOriginal to group bursts
             burst_groups[key].append(fpath)
-    return {k: v for k, v in burst_groups.items() if len(v) > 1}
+    # Shard whole bursts by their key so a burst is never split across shards
+    return {k: v for k, v in burst_groups.items() if len(v) > 1 and in_shard(k, shard)}
 
 
 class ImageSharpnessProcessor:
-    def __init__(self, folder, base_blur=0, tolerance=0):
+    def __init__(self, folder, base_blur=0, tolerance=0, shard=None, schedule=None,
+                 strategy="crop", grid=sharpness.DEFAULT_GRID, subject_aware=False,
+                 ingest_budget=ingest.DEFAULT_BUDGET, score_table=None):
         self.folder = folder
         self.base_blur = base_blur
         self.tolerance = tolerance
+        self.strategy = strategy
+        self.grid = grid
+        self.subject_aware = subject_aware
+        self.detector = None
+        self.ingest_budget = ingest_budget
+        self.shard = shard
+        # Kept in memory so the threshold can be re-tried without another pass over the files
+        self.score_table = score_table if score_table is not None else ScoreTable(folder)
+        self.score_table.offset = base_blur + tolerance
+        self.schedule = schedule or scheduler.plan_schedule()
         self.cancel_flag = multiprocessing.Manager().Value("b", False)
         self.progress_callback = None
 
@@ -119,6 +189,14 @@ class ImageSharpnessProcessor:
         self.cancel_flag.value = True
         print("Cancellation requested...")
 
+    def load_detector(self):
+        if not self.subject_aware:
+            return None
+        # Only import detection (and torch) when subject-aware scoring is on
+        import detection
+        return detection.subject_detector(self.folder, mode="fast",
+                                          cancel_flag=self.cancel_flag, schedule=self.schedule)
+
     def run(self, use_starcheck=False, use_laplaciancheck=True, group_bursts=False, progress_callback=None):
         
         self.progress_callback = progress_callback
@@ -129,89 +207,122 @@ class ImageSharpnessProcessor:
             print("Cancelled before any processing.")
             return
 
+        decoders.select_backends()
+        print(f"Decoders: {decoders.summary()}")
+
         if group_bursts:
             print("Running in Burst Grouping...")
-            burst_groups = find_burst_groups(self.folder)
+            # Bursts are scored in this process, let OpenCV use the worker budget instead
+            scheduler.pin_threads(self.schedule["sharpness_workers"])
+            captures = ingest.list_captures(self.folder, IMAGE_EXTENSIONS)
+            burst_groups = find_burst_groups(self.folder, self.shard, captures)
 
             total_groups = len(burst_groups)
             total_selected = 0
+            removed = 0
+            kept = 0
+            summary = {"mode": "burst", "kept": [], "rejected": [], "scores": {}, "bursts": total_groups,
+                       "decoders": decoders.registry().describe()}
+
+            self.detector = self.load_detector()
 
             if self.cancel_flag.value:
                 print("Cancelled before processing burst groups.")
                 return
 
-            for key, group in burst_groups.items():
-                if self.cancel_flag.value:
-                    print("Cancelled during burst group processing.")
-                    return
-                scored = [(compute_laplacian_variance(p), p) for p in group]
-                scored.sort(reverse=True)
-                for _, path in scored[:2]:
+            # Every burst image is read once; only the best two of the current burst stay in memory
+            items = ingest.iter_ingested([p for group in burst_groups.values() for p in group], self.ingest_budget)
+            try:
+                for key, group in burst_groups.items():
                     if self.cancel_flag.value:
-                        print("Cancelled during burst copying.")
+                        print("Cancelled during burst group processing.")
                         return
-                    shutil.copy(path, os.path.join(output_folder, os.path.basename(path)))
-                    total_selected += 1
-                    print(f"Copied from burst: {os.path.basename(path)}")
+                    scored = []
+                    for _ in group:
+                        item = next(items)
+                        image, boxes = decode_for_scoring(item, self.detector)
+                        if image is None:
+                            print(f"Failed to read {item.name}")
+                            continue
+                        score = sharpness.score(image, self.strategy, self.grid, boxes=boxes)
+                        del image
+                        summary["scores"][item.name] = score
+                        scored.append((score, item.path, item))
+                        scored.sort(key=lambda s: s[:2], reverse=True)
+                        for _, _, dropped in scored[2:]:
+                            dropped.release()
+
+                    for score, path, _ in scored[2:]:
+                        name = os.path.basename(path)
+                        summary["rejected"].append(name)
+                        self.score_table.add(name, score, None, NEVER, companions=captures[name], burst=key)
+                    for score, path, item in scored[:2]:
+                        if self.cancel_flag.value:
+                            print("Cancelled during burst copying.")
+                            return
+                        total_selected += 1
+                        if use_laplaciancheck:
+                            tags = EXIFHelper.read_tags(item)
+                            is_sharp, _ = ImageAnalyzer.judge(score, path, self.base_blur, self.tolerance, tags)
+                            self.score_table.add(item.name, score, ImageAnalyzer.base_threshold(tags), JUDGED,
+                                                 is_sharp, captures[item.name], key)
+                            if not is_sharp:
+                                removed += 1
+                                summary["rejected"].append(item.name)
+                                print(f"Skipped blurry burst image: {item.name}")
+                                item.release()
+                                continue
+                            kept += 1
+                        else:
+                            self.score_table.add(item.name, score, None, ALWAYS, True, captures[item.name], key)
+                        item.write_to(os.path.join(output_folder, item.name))
+                        item.release()
+                        ingest.copy_companions(self.folder, captures[item.name], output_folder)
+                        summary["kept"].append(item.name)
+                        print(f"Copied from burst: {item.name}")
+            finally:
+                items.close()
+
+            self.score_table.sync(output_folder)
 
             print("\nBurst grouping complete.")
             print(f"Total burst groups found: {total_groups}")
             print(f"Total images selected (sharpest from bursts): {total_selected}")
+            if use_laplaciancheck:
+                print(f"Laplacian check on burst selection complete. Kept: {kept}, Removed: {removed}")
             print(f"Output folder: {output_folder}")
 
-            if use_laplaciancheck:
-                print("Running Laplacian check on burst-selected images...")
-                burst_output_images = [f for f in os.listdir(output_folder) if f.lower().endswith(".jpg")]
-                burst_output_paths = [os.path.join(output_folder, f) for f in burst_output_images]
-
-                removed = 0
-                kept = 0
-                for path in burst_output_paths:
-                    image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
-                    if image is None:
-                        continue
-                    is_sharp, laplacian = ImageAnalyzer.is_sharp(image, path, self.base_blur, self.tolerance)
-                    if not is_sharp:
-                        os.remove(path)
-                        removed += 1
-                        print(f"Removed blurry burst image: {os.path.basename(path)}")
-                    else:
-                        kept += 1
-                        print(f"Kept sharp burst image: {os.path.basename(path)}")
-                print(f"Laplacian check on burst output complete. Kept: {kept}, Removed: {removed}")
-
-            return  # Exit after burst + laplacian-on-burst logic
+            return summary  # Exit after burst + laplacian-on-burst logic
 
         if use_laplaciancheck:
             print("Running in Laplacian Sharpness Mode on ALL images...")
 
-            images = [f for f in os.listdir(self.folder) if f.lower().endswith(".jpg")]
-            print(f"Found {len(images)} JPG files to process")
+            captures = ingest.list_captures(self.folder, IMAGE_EXTENSIONS)
+            images = filter_names(list(captures), self.shard)
+            raw_count = sum(1 for f in images if raw_preview.is_raw(f))
+            print(f"Found {len(images)} images to process ({raw_count} RAW without a paired JPG)")
             
             if not images:
-                print("No JPG files found.")
+                print("No image or RAW files found.")
                 return
 
-            args = [
-                (self.folder, f, output_folder, self.base_blur, self.tolerance, use_starcheck, use_laplaciancheck)
-                for f in images
-            ]
-            pool_size = max(1, multiprocessing.cpu_count() - 2)
-
-            with multiprocessing.Pool(pool_size) as pool:
-                result_async = pool.starmap_async(process_image_static, args)
+            if self.subject_aware:
+                results = self.run_with_detector(images, captures, output_folder, use_starcheck, use_laplaciancheck)
+                if results is None:
+                    return
+            else:
+                results = self.run_pool(images, captures, output_folder, use_starcheck, use_laplaciancheck)
+                if results is None:
+                    return
 
-                while not result_async.ready():
-                    if self.cancel_flag.value:
-                        pool.terminate()
-                        pool.join()
-                        print("Cancelled.")
-                        return
-                    if self.progress_callback:
-                        self.progress_callback("Processing...")
-                    time.sleep(0.1)
+            for r in results:
+                if r:
+                    # A rating keeps the image without a score
+                    name, is_sharp, score, base, taken = r
+                    self.score_table.add(name, score, base, JUDGED if score is not None else RATED, is_sharp,
+                                         captures[name], taken)
 
-                results = result_async.get()
+            self.score_table.sync(output_folder)
 
             sharp = sum(1 for r in results if r and r[1])
             blurry = sum(1 for r in results if r and not r[1])
@@ -221,52 +332,150 @@ class ImageSharpnessProcessor:
             print(f"Blurry: {blurry}")
             print(f"Total processed: {len([r for r in results if r])}")
             print(f"Output folder: {output_folder}")
-            return
+            return {
+                "mode": "laplacian",
+                "kept": [r[0] for r in results if r and r[1]],
+                "rejected": [r[0] for r in results if r and not r[1]],
+                "scores": {r[0]: r[2] for r in results if r and r[2] is not None},
+                "bursts": 0,
+                "decoders": decoders.registry().describe(),
+            }
 
         print("No processing enabled. Please enable either burst grouping or Laplacian check.")
 
+    def run_pool(self, images, captures, output_folder, use_starcheck, use_laplaciancheck):
+        # Each worker reads its own files, at most one at a time and within the shared ingest budget
+        args = [
+            (self.folder, f, output_folder, self.base_blur, self.tolerance, use_starcheck, use_laplaciancheck,
+             self.strategy, self.grid, captures[f])
+            for f in images
+        ]
+        pool_size = self.schedule["sharpness_workers"]
+        print(scheduler.describe(self.schedule))
+
+        # Pin each worker's OpenCV pool so workers x threads stays within the CPU budget
+        scheduler.set_thread_env(self.schedule["cv_threads"])
+        # Workers reuse the decoder picked by this process's benchmark and share the ingest budget
+        budget = ingest.SharedBudget(self.ingest_budget)
+        with multiprocessing.Pool(pool_size, initializer=init_worker,
+                                  initargs=(self.schedule["cv_threads"], decoders.select_backends(), budget)) as pool:
+            result_async = pool.starmap_async(
+                process_image_static, args,
+                chunksize=scheduler.chunk_size(len(args), pool_size, self.schedule)
+            )
+
+            while not result_async.ready():
+                if self.cancel_flag.value:
+                    pool.terminate()
+                    pool.join()
+                    print("Cancelled.")
+                    return None
+                if self.progress_callback:
+                    self.progress_callback("Processing...")
+                time.sleep(0.1)
+
+            return result_async.get()
+
+    def run_with_detector(self, images, captures, output_folder, use_starcheck, use_laplaciancheck):
+        # Detection dominates here, so decode once in this process and score the subject right away
+        self.detector = self.load_detector()
+        paths = [os.path.join(self.folder, f) for f in images]
+        results = []
+        items = ingest.iter_ingested(paths, self.ingest_budget)
+        try:
+            for item in items:
+                if self.cancel_flag.value:
+                    print("Cancelled.")
+                    return None
+                results.append(process_ingested(item, output_folder, self.base_blur, self.tolerance,
+                                                use_starcheck, use_laplaciancheck, self.strategy, self.grid,
+                                                captures[item.name], self.detector))
+                item.release()
+                if self.progress_callback:
+                    self.progress_callback("Processing...")
+        finally:
+            items.close()
+        return results
+
+
+
+_ingest_budget = None
+
 
+def init_worker(cv_threads, decoder_choices, budget=None):
+    global _ingest_budget
+    scheduler.init_worker(cv_threads)
+    decoders.configure(decoder_choices)
+    _ingest_budget = budget
 
-def process_image_static(folder, filename, output_folder, base_blur, tolerance, use_starcheck, use_laplacian):
-    if not filename.lower().endswith(".jpg"):
+
+def process_ingested(item, output_folder, base_blur, tolerance, use_starcheck, use_laplacian,
+                     strategy="crop", grid=sharpness.DEFAULT_GRID, companions=(), detector=None):
+    filename = item.name
+    if item.data is None:
         return None
 
-    path = os.path.join(folder, filename)
-    image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    # EXIF, decode and the copy all come from the one buffer
+    tags = EXIFHelper.read_tags(item)
+    image, boxes = decode_for_scoring(item, detector)
 
-    try:
-        if image is None:
-            print(f"Failed to read {filename}")
-            return None
+    if image is None:
+        print(f"Failed to read {filename}")
+        return None
 
-        if use_starcheck and EXIFHelper.get_rating(path) != "0":
-            return filename, True, None
+    # Capture time, so the review can group these by burst too
+    taken = EXIFHelper.get_datetime_original(tags)
 
-        if use_laplacian:
-            is_sharp, laplacian = ImageAnalyzer.is_sharp(image, path, base_blur, tolerance)
-            if is_sharp:
-                shutil.copy(path, os.path.join(output_folder, filename))
-            return filename, is_sharp, laplacian
+    if use_starcheck and EXIFHelper.get_rating(tags) > 0:
+        # A rated image counts as sharp, so it goes to Sharp/ like one that passed the check
+        item.write_to(os.path.join(output_folder, filename))
+        ingest.copy_companions(os.path.dirname(item.path), companions, output_folder)
+        return filename, True, None, None, taken
 
-    finally:
-        del image
-        cv2.destroyAllWindows()
+    if use_laplacian:
+        is_sharp, laplacian = ImageAnalyzer.is_sharp(image, item.path, base_blur, tolerance, strategy, grid,
+                                                     boxes, tags)
+        if is_sharp:
+            item.write_to(os.path.join(output_folder, filename))
+            # Paired RAW / JPEG and sidecars go wherever the shot goes
+            ingest.copy_companions(os.path.dirname(item.path), companions, output_folder)
+        return filename, is_sharp, laplacian, ImageAnalyzer.base_threshold(tags), taken
 
     return None
 
 
+def process_image_static(folder, filename, output_folder, base_blur, tolerance, use_starcheck, use_laplacian,
+                         strategy="crop", grid=sharpness.DEFAULT_GRID, companions=()):
+    if not (filename.lower().endswith(IMAGE_EXTENSIONS) or raw_preview.is_raw(filename)):
+        return None
+
+    with ingest.read_within(os.path.join(folder, filename), _ingest_budget) as item:
+        try:
+            return process_ingested(item, output_folder, base_blur, tolerance, use_starcheck, use_laplacian,
+                                    strategy, grid, companions)
+        finally:
+            item.release()
+
+
 def main(folder, base_blur=0, tolerance=0,
          use_starcheck=False, use_laplaciancheck=True, group_bursts=True,
-         cancel_flag=None, progress_callback=None):
+         cancel_flag=None, progress_callback=None, shard=None, schedule=None,
+         strategy="crop", grid=sharpness.DEFAULT_GRID, subject_aware=False,
+         ingest_budget=ingest.DEFAULT_BUDGET, score_table=None):
+
+    if strategy not in sharpness.STRATEGIES:
+        raise ValueError(f"Strategy must be one of {', '.join(sharpness.STRATEGIES)}")
 
-    processor = ImageSharpnessProcessor(folder, base_blur, tolerance)
+    processor = ImageSharpnessProcessor(folder, base_blur, tolerance, shard=shard, schedule=schedule,
+                                        strategy=strategy, grid=grid, subject_aware=subject_aware,
+                                        ingest_budget=ingest_budget, score_table=score_table)
 
     if cancel_flag:
         processor.cancel_flag = cancel_flag
 
-    processor.run(
+    return processor.run(
         use_starcheck=use_starcheck,
         use_laplaciancheck=use_laplaciancheck,
         group_bursts=group_bursts,
         progress_callback=progress_callback
-    ) 
\ No newline at end of file
+    )
\ No newline at end of file
@@ -0,0 +1,205 @@
+import os
+import sys
+import time
+import argparse
+from multiprocessing import freeze_support
+
+import sharding
+import scheduler
+import sharpness
+import ingest
+import decoders
+
+# Same values as the Low / Medium / High buttons in the GUI
+BLUR_LEVELS = {"low": -20, "medium": 0, "high": 30}
+
+
+def default_manifest_path(folder, shard):
+    if shard is None:
+        return os.path.join(folder, "culler-manifest.json")
+    index, count = shard
+    return os.path.join(folder, f"culler-manifest-{index}-of-{count}.json")
+
+
+def run_command(args):
+    folder = os.path.abspath(args.folder)
+    if not os.path.isdir(folder):
+        print(f"Folder not found: {folder}")
+        return 1
+
+    shard = sharding.parse_shard(args.shard) if args.shard else None
+    base_blur = args.base_blur if args.base_blur is not None else BLUR_LEVELS[args.blur_level]
+    sorting = args.laplacian or args.starcheck or args.bursts
+    grid = sharpness.parse_grid(args.grid)
+    ingest_budget = args.ingest_budget * 1024 * 1024
+    schedule = scheduler.plan_schedule(
+        jobs=args.jobs,
+        reserve=args.reserve,
+        workers=args.workers,
+        cv_threads=args.cv_threads,
+        detection_threads=args.detection_threads
+    )
+    print(scheduler.describe(schedule))
+
+    start_time = time.time()
+    manifest = {
+        "folder": folder,
+        "shard": list(shard) if shard else [0, 1],
+        "options": {
+            "base_blur": base_blur,
+            "tolerance": args.tolerance,
+            "use_starcheck": args.starcheck,
+            "use_laplaciancheck": args.laplacian,
+            "group_bursts": args.bursts,
+            "strategy": args.strategy,
+            "grid": list(grid),
+            "subject_aware": args.subject_aware,
+            "ingest_budget_mb": args.ingest_budget,
+            "detect": args.detect,
+            "detection_mode": args.detection_mode,
+        },
+        "schedule": schedule,
+        "sharpness": None,
+        "detection": None,
+    }
+
+    if sorting:
+        import blur_sorter as blur
+        manifest["sharpness"] = blur.main(
+            folder,
+            base_blur=base_blur,
+            tolerance=args.tolerance,
+            use_starcheck=args.starcheck,
+            use_laplaciancheck=args.laplacian,
+            group_bursts=args.bursts,
+            shard=shard,
+            schedule=schedule,
+            strategy=args.strategy,
+            grid=grid,
+            subject_aware=args.subject_aware,
+            ingest_budget=ingest_budget
+        )
+
+    if args.detect:
+        import detection as detect
+        if sorting:
+            # Only detect what this shard kept, other shards may still be filling Sharp/
+            kept = (manifest["sharpness"] or {}).get("kept", [])
+            manifest["detection"] = detect.main(folder, mode=args.detection_mode, solo_process=False,
+                                                files=kept, schedule=schedule, ingest_budget=ingest_budget)
+        else:
+            manifest["detection"] = detect.main(folder, mode=args.detection_mode, solo_process=True,
+                                                shard=shard, schedule=schedule, ingest_budget=ingest_budget)
+
+    manifest["elapsed"] = time.time() - start_time
+    manifest["decoders"] = decoders.registry().describe()
+
+    manifest_path = args.manifest or default_manifest_path(folder, shard)
+    sharding.write_manifest(manifest_path, manifest)
+    print(f"Manifest written to {manifest_path}")
+    return 0
+
+
+def merge_command(args):
+    manifests = [sharding.read_manifest(p) for p in args.manifests]
+    merged = sharding.merge_manifests(manifests)
+
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(args.manifests[0])), "culler-manifest.json")
+    sharding.write_manifest(output, merged)
+
+    sharpness = merged["sharpness"]
+    print(f"Merged {len(manifests)} of {merged['shard_count']} shard(s)")
+    if merged["missing_shards"]:
+        print(f"WARNING: missing shard(s): {merged['missing_shards']}")
+    print(f"Sharp: {len(sharpness['kept'])}")
+    print(f"Blurry: {len(sharpness['rejected'])}")
+    print(f"Burst groups: {sharpness['bursts']}")
+    print(f"Detected: {len(merged['detection']['routed'])} of {merged['detection']['processed']} processed")
+    print(f"Wall time: {merged['elapsed']:.2f}s, total shard time: {merged['shard_seconds']:.2f}s")
+    print(f"Merged manifest written to {output}")
+    return 1 if merged["missing_shards"] else 0
+
+
+def autotune_command(args):
+    folder = os.path.abspath(args.folder)
+    if not os.path.isdir(folder):
+        print(f"Folder not found: {folder}")
+        return 1
+
+    import blur_sorter as blur
+    # One file per shot, the JPEG of a RAW + JPEG pair or the RAW on its own
+    names = sorted(ingest.list_captures(folder, blur.IMAGE_EXTENSIONS))[:args.sample]
+    if not names:
+        print("No image or RAW files found.")
+        return 1
+
+    paths = [os.path.join(folder, f) for f in names]
+    scheduler.autotune(paths, budget=args.cpus, detection_mode=args.detection_mode)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="image-culler", description="Headless Image Culler")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Sort a folder (or one shard of it)")
+    run.add_argument("folder", help="Folder containing the images")
+    run.add_argument("--blur-level", choices=sorted(BLUR_LEVELS), default="medium",
+                     help="Sharpness threshold preset (default: medium)")
+    run.add_argument("--base-blur", type=int, default=None,
+                     help="Raw base blur offset, overrides --blur-level")
+    run.add_argument("--tolerance", type=int, default=0,
+                     help="Threshold compensation, positive is stricter")
+    run.add_argument("--starcheck", action="store_true", help="Keep images that have a star rating")
+    run.add_argument("--no-laplacian", dest="laplacian", action="store_false", help="Disable the Laplacian check")
+    run.add_argument("--no-bursts", dest="bursts", action="store_false", help="Disable burst grouping")
+    run.add_argument("--strategy", choices=sharpness.STRATEGIES, default="crop",
+                     help="How to score sharpness: center crop, or max / top-k / center-weighted tile grid")
+    run.add_argument("--grid", default="x".join(map(str, sharpness.DEFAULT_GRID)), metavar="ROWSxCOLS",
+                     help="Tile grid for the grid strategies (default: %(default)s)")
+    run.add_argument("--subject-aware", action="store_true",
+                     help="Score sharpness only inside detected people / balls (falls back to --strategy)")
+    run.add_argument("--detect", action="store_true", help="Run subject detection after sorting")
+    run.add_argument("--detection-mode", choices=["fast", "accurate"], default="accurate")
+    run.add_argument("--shard", default=None, metavar="I/N",
+                     help="Only process shard I of N, e.g. 0/4")
+    run.add_argument("--manifest", default=None, help="Where to write this run's manifest")
+    run.add_argument("--ingest-budget", type=int, default=ingest.DEFAULT_BUDGET // (1024 * 1024), metavar="MB",
+                     help="File data read ahead / held in memory at once (default: %(default)s MB)")
+    run.add_argument("--jobs", type=int, default=1,
+                     help="Number of culler processes sharing this machine, splits the CPU budget")
+    run.add_argument("--reserve", type=int, default=0,
+                     help="CPUs to leave free for other work (default: 0)")
+    run.add_argument("--workers", type=int, default=None, help="Override the number of sharpness workers")
+    run.add_argument("--cv-threads", type=int, default=None, help="Override OpenCV threads per worker")
+    run.add_argument("--detection-threads", type=int, default=None, help="Override torch threads for detection")
+    run.set_defaults(func=run_command)
+
+    merge = commands.add_parser("merge", help="Combine per-shard manifests")
+    merge.add_argument("manifests", nargs="+", help="Manifest files written by 'run'")
+    merge.add_argument("--output", default=None, help="Where to write the merged manifest")
+    merge.set_defaults(func=merge_command)
+
+    autotune = commands.add_parser("autotune", help="Find the fastest worker/thread layout for this machine")
+    autotune.add_argument("folder", help="Folder with sample images")
+    autotune.add_argument("--sample", type=int, default=64, help="Number of images to time (default: 64)")
+    autotune.add_argument("--cpus", type=int, default=None, help="CPU budget to tune for (default: detected)")
+    autotune.add_argument("--detection-mode", choices=["fast", "accurate"], default=None,
+                          help="Also tune detection threads for this mode")
+    autotune.set_defaults(func=autotune_command)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 2
+
+
+if __name__ == "__main__":
+    freeze_support()
+    sys.exit(main())
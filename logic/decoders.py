@@ -0,0 +1,297 @@
+import io
+import time
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJPF_GRAY
+except ImportError:
+    TurboJPEG = None
+
+try:
+    # Registers HEIC / HEIF with PIL when installed
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIF_SUPPORT = True
+except ImportError:
+    HEIF_SUPPORT = False
+
+FORMATS = ("jpeg", "png", "tiff", "webp", "heic")
+EXTENSIONS = {
+    "jpeg": (".jpg", ".jpeg"),
+    "png": (".png",),
+    "tiff": (".tif", ".tiff"),
+    "webp": (".webp",),
+    "heic": (".heic", ".heif"),
+}
+BENCHMARK_SIZE = (1024, 768)  # big enough to rank decoders, small enough to run at every start
+BENCHMARK_REPEATS = 2
+
+ORIENTATION_TAG = 0x0112
+
+
+def sniff(data):
+    head = bytes(data[:16])
+    if head[:2] == b"\xff\xd8":
+        return "jpeg"
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"heic", b"heix", b"hevc", b"mif1", b"msf1"):
+        return "heic"
+    return None
+
+
+def _orientation(data):
+    # EXIF orientation of a JPEG buffer, for backends that don't apply it themselves
+    import ingest  # ingest imports this module, so import it late
+    segment = ingest.exif_segment(data)
+    if not segment:
+        return 1
+    try:
+        exif = Image.Exif()
+        exif.load(bytes(segment))
+        return exif.get(ORIENTATION_TAG, 1)
+    except Exception:
+        return 1
+
+
+def apply_orientation(image, orientation):
+    if orientation == 2:
+        return cv2.flip(image, 1)
+    if orientation == 3:
+        return cv2.rotate(image, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(image, 0)
+    if orientation == 5:
+        return cv2.flip(cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE), 1)
+    if orientation == 6:
+        return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.flip(cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE), 1)
+    if orientation == 8:
+        return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return image
+
+
+class Decoder(ABC):
+    # Every backend returns uint8 arrays like cv2.imdecode: HxW for gray, HxWx3 BGR for color,
+    # with the EXIF orientation applied
+    name = "base"
+    formats = ()
+    scaled_formats = ()  # can decode at 1/2, 1/4, 1/8 size without decoding the full image
+    gray_formats = ()  # can produce grayscale without a color decode + conversion
+
+    @abstractmethod
+    def decode(self, data, gray=True, scale=1):
+        pass
+
+
+class OpenCVDecoder(Decoder):
+    name = "opencv"
+    formats = ("jpeg", "png", "tiff", "webp")
+    scaled_formats = ("jpeg",)
+    gray_formats = ("jpeg",)  # libjpeg outputs luma directly, the others convert after decoding
+
+    REDUCED = {
+        (True, 2): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+        (True, 4): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+        (True, 8): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+        (False, 2): cv2.IMREAD_REDUCED_COLOR_2,
+        (False, 4): cv2.IMREAD_REDUCED_COLOR_4,
+        (False, 8): cv2.IMREAD_REDUCED_COLOR_8,
+    }
+
+    def decode(self, data, gray=True, scale=1):
+        flags = self.REDUCED.get((gray, scale), cv2.IMREAD_GRAYSCALE if gray else cv2.IMREAD_COLOR)
+        return cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+
+
+class PILDecoder(Decoder):
+    name = "pil"
+    formats = ("jpeg", "png", "tiff", "webp") + (("heic",) if HEIF_SUPPORT else ())
+    scaled_formats = ("jpeg",)
+    gray_formats = ("jpeg",)  # through draft("L")
+
+    def decode(self, data, gray=True, scale=1):
+        with Image.open(io.BytesIO(data)) as img:
+            if img.format == "JPEG":
+                # draft() makes libjpeg decode straight to L and / or at a reduced size
+                img.draft("L" if gray else "RGB", (img.width // scale, img.height // scale))
+            img = ImageOps.exif_transpose(img)
+            if gray:
+                return np.asarray(img.convert("L"))
+            return cv2.cvtColor(np.asarray(img.convert("RGB")), cv2.COLOR_RGB2BGR)
+
+
+class TurboJPEGDecoder(Decoder):
+    name = "turbojpeg"
+    formats = ("jpeg",)
+    scaled_formats = ("jpeg",)
+    gray_formats = ("jpeg",)
+
+    def __init__(self):
+        self.jpeg = TurboJPEG()
+
+    def decode(self, data, gray=True, scale=1):
+        image = self.jpeg.decode(
+            bytes(data),
+            pixel_format=TJPF_GRAY if gray else TJPF_BGR,
+            scaling_factor=(1, scale) if scale > 1 else None
+        )
+        if gray and image.ndim == 3:
+            image = image[:, :, 0]
+        return apply_orientation(image, _orientation(data))
+
+
+def available_decoders():
+    decoders = [OpenCVDecoder(), PILDecoder()]
+    if TurboJPEG is not None:
+        try:
+            decoders.append(TurboJPEGDecoder())
+        except (OSError, RuntimeError) as e:  # bindings installed but libturbojpeg missing
+            print(f"libjpeg-turbo not available: {e}")
+    return decoders
+
+
+def _benchmark_samples():
+    # Noise over a gradient, closer to a photo's entropy than a flat test card
+    w, h = BENCHMARK_SIZE
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 200, w, dtype=np.float32)[None, :, None]
+    image = np.clip(gradient + rng.normal(0, 25, (h, w, 3)), 0, 255).astype(np.uint8)
+
+    samples = {}
+    for fmt, ext in (("jpeg", ".jpg"), ("png", ".png"), ("tiff", ".tiff"), ("webp", ".webp")):
+        ok, encoded = cv2.imencode(ext, image)
+        if ok:
+            samples[fmt] = encoded.tobytes()
+    return samples
+
+
+class DecoderRegistry:
+    def __init__(self, decoders=None):
+        self.decoders = {d.name: d for d in (decoders or available_decoders())}
+        self.choices = {}  # "jpeg/gray" -> backend name
+        self.timings = {}  # "jpeg/gray" -> {backend name: seconds}
+
+    def register(self, decoder):
+        self.decoders[decoder.name] = decoder
+        self.choices = {}
+
+    def capable(self, fmt, gray=False):
+        decoders = [d for d in self.decoders.values() if fmt in d.formats]
+        if gray:
+            # A backend that decodes straight to gray beats one that converts a color decode
+            direct = [d for d in decoders if fmt in d.gray_formats]
+            return direct or decoders
+        return decoders
+
+    def benchmark(self, samples=None):
+        samples = samples or _benchmark_samples()
+        for fmt in FORMATS:
+            for mode in ("gray", "color"):
+                candidates = self.capable(fmt, gray=(mode == "gray"))
+                key = f"{fmt}/{mode}"
+                if len(candidates) == 1 or fmt not in samples:
+                    if candidates:
+                        self.choices[key] = candidates[0].name
+                    continue
+                timings = {}
+                for decoder in candidates:
+                    try:
+                        best = float("inf")
+                        for _ in range(BENCHMARK_REPEATS):
+                            start = time.perf_counter()
+                            decoder.decode(samples[fmt], gray=(mode == "gray"))
+                            best = min(best, time.perf_counter() - start)
+                        timings[decoder.name] = best
+                    except Exception as e:
+                        print(f"Decoder {decoder.name} failed on {fmt}: {e}")
+                if timings:
+                    self.timings[key] = timings
+                    self.choices[key] = min(timings, key=timings.get)
+        return self.choices
+
+    def configure(self, choices):
+        # Workers reuse the parent's benchmark instead of running their own
+        self.choices = {k: v for k, v in choices.items() if v in self.decoders}
+
+    def select(self, fmt, gray, scale=1):
+        if not self.choices:
+            self.benchmark()
+        chosen = self.decoders.get(self.choices.get(f"{fmt}/{'gray' if gray else 'color'}"))
+        if scale > 1 and (chosen is None or fmt not in chosen.scaled_formats):
+            scaled = [d for d in self.capable(fmt, gray) if fmt in d.scaled_formats]
+            if scaled:
+                return scaled[0], True
+        if chosen is None:
+            capable = self.capable(fmt, gray)
+            chosen = capable[0] if capable else self.decoders["opencv"]
+        return chosen, fmt in chosen.scaled_formats
+
+    def decode(self, data, gray=True, scale=1):
+        if data is None:
+            return None
+        fmt = sniff(data)
+        decoder, scales = self.select(fmt, gray, scale)
+        try:
+            image = decoder.decode(data, gray=gray, scale=scale if scales else 1)
+        except Exception as e:
+            print(f"{decoder.name} could not decode {fmt or 'image'}: {e}")
+            return None
+        if image is not None and scale > 1 and not scales:
+            h, w = image.shape[:2]
+            image = cv2.resize(image, (max(1, w // scale), max(1, h // scale)), interpolation=cv2.INTER_AREA)
+        return image
+
+    def describe(self):
+        # Whether each gray choice decodes straight to gray, recorded with the run's metrics
+        gray_direct = {}
+        for key, name in self.choices.items():
+            fmt, mode = key.split("/")
+            if mode == "gray":
+                gray_direct[key] = fmt in self.decoders[name].gray_formats
+        return {"choices": dict(self.choices), "timings": dict(self.timings), "gray_direct": gray_direct}
+
+
+_registry = None
+
+
+def registry():
+    global _registry
+    if _registry is None:
+        _registry = DecoderRegistry()
+    return _registry
+
+
+def decode(data, gray=True, scale=1):
+    return registry().decode(data, gray, scale)
+
+
+def image_extensions():
+    # File extensions of every format some installed backend can decode, for both stages
+    formats = {fmt for decoder in registry().decoders.values() for fmt in decoder.formats}
+    return tuple(ext for fmt in FORMATS if fmt in formats for ext in EXTENSIONS[fmt])
+
+
+def select_backends():
+    reg = registry()
+    if not reg.choices:
+        reg.benchmark()
+    return dict(reg.choices)
+
+
+def configure(choices):
+    registry().configure(choices)
+
+
+def summary():
+    choices = registry().choices
+    return ", ".join(f"{key}: {name}" for key, name in sorted(choices.items()))
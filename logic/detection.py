@@ -1,15 +1,38 @@
 import os
 import time
-import shutil
 import multiprocessing
 from itertools import combinations
 from ultralytics import YOLO
 import gc
+from sharding import filter_names
+import scheduler
+import ingest
+import decoders
+
+IMAGE_EXTENSIONS = decoders.image_extensions()  # plus the RAW formats in raw_preview
+
+MODES = {
+    "fast": {
+        "model_path": "yolov8s.pt",
+        "conf": 0.6,
+        "imgsz": 320
+    },
+    "accurate": {
+        "model_path": "yolov8m.pt",
+        "conf": 0.4,
+        "imgsz": 640
+    },
+}
 
 
 class AISorter:
-    def __init__(self, input_folder, solo, model_path="yolov8m.pt", target_classes=None, conf=0.4, imgsz=320):
-        
+    def __init__(self, input_folder, solo, model_path="yolov8m.pt", target_classes=None, conf=0.4, imgsz=320,
+                 schedule=None, ingest_budget=ingest.DEFAULT_BUDGET):
+
+        # torch sizes its intra-op pool from the host core count, not the container quota
+        self.schedule = schedule or scheduler.plan_schedule()
+        scheduler.pin_threads(self.schedule["detection_threads"], torch_threads=True)
+
         # Fix: Set input_folder first, then modify it if needed
         self.input_folder = input_folder
         if not solo:
@@ -19,14 +42,19 @@ class AISorter:
         self.model = YOLO(model_path)
         self.conf = conf
         self.imgsz = imgsz
+        self.ingest_budget = ingest_budget
         self.cancel_flag = multiprocessing.Manager().Value("b", False)
         self.progress_callback = None
+        self.routed = {}
+        self.captures = {}
         self.target_classes = target_classes or {
             0: "Person",
             32: "Sports_ball"
         }
 
         print("Using device:", self.model.device)
+        decoders.select_backends()
+        print(f"Decoders: {decoders.summary()}")
 
     def cancel(self):
         self.cancel_flag.value = True
@@ -40,18 +68,30 @@ class AISorter:
                 folder_name = "_and_".join(sorted(combo))
                 os.makedirs(os.path.join(self.output_base, folder_name), exist_ok=True)
 
-    def _process_single_image(self, image_path):
-        if self.cancel_flag.value:
-            return False
-
-        results = self.model(image_path, imgsz=self.imgsz, conf=self.conf, verbose=False)
+    def detect_boxes(self, image):
+        # image is a path or an already decoded BGR array
+        results = self.model(image, imgsz=self.imgsz, conf=self.conf, verbose=False)
         result = results[0]
 
-        detected_ids = {
-            int(box.cls.item())
+        # Boxes are in original image pixels as (class_id, (x1, y1, x2, y2))
+        return [
+            (int(box.cls.item()), tuple(int(v) for v in box.xyxy[0].tolist()))
             for box in result.boxes
             if int(box.cls.item()) in self.target_classes
-        }
+        ]
+
+    def _process_single_image(self, item):
+        if self.cancel_flag.value:
+            return False
+
+        # Decode from the buffer that is also written out, so the file is only read once
+        image = item.decode(gray=False)
+        if image is None:
+            print(f"Failed to read {item.name}")
+            return False
+
+        detected_ids = {class_id for class_id, _ in self.detect_boxes(image)}
+        del image
 
         if not detected_ids:
             return True
@@ -61,22 +101,27 @@ class AISorter:
         dest_folder = os.path.join(self.output_base, folder_name)
         os.makedirs(dest_folder, exist_ok=True)
 
-        dest_path = os.path.join(dest_folder, os.path.basename(image_path))
-        shutil.copyfile(image_path, dest_path)
-        print(f"✔ Moved {os.path.basename(image_path)} to {folder_name}")
+        dest_path = os.path.join(dest_folder, item.name)
+        item.write_to(dest_path, copy_mode=False)
+        ingest.copy_companions(self.input_folder, self.captures.get(item.name, ()), dest_folder)
+        self.routed[item.name] = folder_name
+        print(f"✔ Moved {item.name} to {folder_name}")
         return True
 
     #Main Logic
-    def process_images_singlethreaded(self, progress_callback=None):
+    def process_images_singlethreaded(self, progress_callback=None, shard=None, files=None):
         self.progress_callback = progress_callback
         start_time = time.time()
         self._create_class_folders()
 
-        image_paths = [
-            os.path.join(self.input_folder, f)
-            for f in os.listdir(self.input_folder)
-            if f.lower().endswith((".jpg", ".jpeg", ".png"))
-        ]
+        # Paired RAW / JPEG files and sidecars are routed along with the image that was detected
+        self.captures = ingest.list_captures(self.input_folder, IMAGE_EXTENSIONS)
+        if files is not None:
+            names = [f for f in files if f in self.captures]
+        else:
+            names = filter_names(list(self.captures), shard)
+
+        image_paths = [os.path.join(self.input_folder, f) for f in names]
 
         if not image_paths:
             print("No images found.")
@@ -85,16 +130,21 @@ class AISorter:
         print(f"Processing {len(image_paths)} images with single-threaded YOLO inference...")
 
         processed_count = 0
-        for path in image_paths:
-            if self.cancel_flag.value:
-                print("Processing cancelled by user.")
-                break
-            
-            success = self._process_single_image(path)
-            if success:
-                processed_count += 1
-                if self.progress_callback:
-                    self.progress_callback(processed_count, len(image_paths))
+        items = ingest.iter_ingested(image_paths, self.ingest_budget)
+        try:
+            for item in items:
+                if self.cancel_flag.value:
+                    print("Processing cancelled by user.")
+                    break
+
+                success = self._process_single_image(item)
+                item.release()
+                if success:
+                    processed_count += 1
+                    if self.progress_callback:
+                        self.progress_callback(processed_count, len(image_paths))
+        finally:
+            items.close()
 
         gc.collect()
         if not self.cancel_flag.value:
@@ -103,33 +153,44 @@ class AISorter:
 
 
 #Entry Point
-def main(folder, mode="fast", solo_process=None, cancel_flag=None, progress_callback=None):
-    if mode == "fast":
-        config = {
-            "model_path": "yolov8s.pt",
-            "conf": 0.6,
-            "imgsz": 320
-        }
-    elif mode == "accurate":
-        config = {
-            "model_path": "yolov8m.pt",
-            "conf": 0.4,
-            "imgsz": 640
-        }
-    else:
+def main(folder, mode="fast", solo_process=None, cancel_flag=None, progress_callback=None,
+         shard=None, files=None, schedule=None, ingest_budget=ingest.DEFAULT_BUDGET):
+    if mode not in MODES:
         raise ValueError("Mode must be either 'fast' or 'accurate'")
-    
-    
+    config = MODES[mode]
 
     sorter = AISorter(
         input_folder=folder,
         model_path=config["model_path"],
         solo = solo_process,
         conf=config["conf"],
-        imgsz=config["imgsz"]
+        imgsz=config["imgsz"],
+        schedule=schedule,
+        ingest_budget=ingest_budget
     )
     
     if cancel_flag:
         sorter.cancel_flag = cancel_flag
         
-    return sorter.process_images_singlethreaded(progress_callback=progress_callback)
\ No newline at end of file
+    processed = sorter.process_images_singlethreaded(
+        progress_callback=progress_callback,
+        shard=shard,
+        files=files
+    )
+    return {"processed": processed or 0, "routed": dict(sorter.routed), "decoders": decoders.registry().describe()}
+
+
+def subject_detector(folder, mode="fast", cancel_flag=None, schedule=None):
+    config = MODES[mode]
+    sorter = AISorter(
+        input_folder=folder,
+        solo=True,
+        model_path=config["model_path"],
+        conf=config["conf"],
+        imgsz=config["imgsz"],
+        schedule=schedule
+    )
+
+    if cancel_flag:
+        sorter.cancel_flag = cancel_flag
+    return sorter
\ No newline at end of file
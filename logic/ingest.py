@@ -0,0 +1,329 @@
+import io
+import os
+import shutil
+import struct
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+
+import decoders
+import raw_preview
+
+DEFAULT_BUDGET = 256 * 1024 * 1024  # bytes of file data read ahead / held at once
+DEFAULT_READERS = 4
+
+EXIF_HEADER = b"Exif\x00\x00"
+RAW_HEADER_BYTES = 512 * 1024  # enough for the metadata at the start of RAW files
+SIDECAR_EXTENSIONS = (".xmp",)
+
+
+class Ingested:
+    # One file read from disk exactly once, everything else works off `data`
+    __slots__ = ("path", "data", "_preview", "_raw_exif")
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+        self._preview = None
+        self._raw_exif = None
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    @property
+    def size(self):
+        return len(self.data) if self.data is not None else 0
+
+    @property
+    def is_raw(self):
+        return raw_preview.is_raw(self.path)
+
+    def _extract_raw(self):
+        if self._raw_exif is None:
+            self._preview, self._raw_exif = raw_preview.extract(self.data)
+
+    @property
+    def image_data(self):
+        # What gets decoded: the file itself, or the camera's embedded JPEG for RAW files
+        if self.data is None or not self.is_raw:
+            return self.data
+        self._extract_raw()
+        return self._preview
+
+    def exif_blocks(self):
+        if self.data is None:
+            return []
+        if not self.is_raw:
+            return [embedded_exif(self.data)]
+        self._extract_raw()
+        # Fall back to the Exif block of the preview when the RAW's own tags can't be read
+        return self._raw_exif + [exif_segment(self._preview)]
+
+    def decode(self, gray=True, scale=1):
+        return decoders.decode(self.image_data, gray=gray, scale=scale)
+
+    def write_to(self, dest_path, copy_mode=True):
+        with open(dest_path, "wb") as f:
+            f.write(self.data)
+        if copy_mode:
+            # Same as shutil.copy, only touches metadata of the source
+            shutil.copymode(self.path, dest_path)
+
+    def release(self):
+        self.data = None
+        self._preview = None
+        self._raw_exif = None
+
+
+def read(path):
+    try:
+        with open(path, "rb", buffering=0) as f:
+            return Ingested(path, f.readall())
+    except OSError as e:
+        print(f"Failed to read {os.path.basename(path)}: {e}")
+        return Ingested(path, None)
+
+
+def read_head(path, size=RAW_HEADER_BYTES):
+    try:
+        with open(path, "rb") as f:
+            return f.read(size)
+    except OSError as e:
+        print(f"Failed to read {os.path.basename(path)}: {e}")
+        return b""
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def iter_ingested(paths, budget=DEFAULT_BUDGET, readers=DEFAULT_READERS):
+    # Reads ahead on a few threads, in order. The item handed out counts against
+    # the budget until the caller asks for the next one.
+    pending = deque()
+    in_flight = 0
+    with ThreadPoolExecutor(max_workers=readers) as pool:
+        for path in paths:
+            size = _size(path)
+            while pending and in_flight + size > budget:
+                future, held = pending.popleft()
+                yield future.result()
+                in_flight -= held
+            pending.append((pool.submit(read, path), size))
+            in_flight += size
+
+        while pending:
+            future, held = pending.popleft()
+            yield future.result()
+            in_flight -= held
+
+
+class SharedBudget:
+    # The same byte budget as iter_ingested, shared by pool workers that each read their own files
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.budget = budget
+        self.in_use = multiprocessing.Value("q", 0, lock=False)
+        self.condition = multiprocessing.Condition()
+
+    @contextmanager
+    def hold(self, size):
+        with self.condition:
+            # A file larger than the whole budget is still read, just on its own
+            while self.in_use.value and self.in_use.value + size > self.budget:
+                self.condition.wait()
+            self.in_use.value += size
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.in_use.value -= size
+                self.condition.notify_all()
+
+
+@contextmanager
+def read_within(path, budget=None):
+    # read() that waits for room in a SharedBudget, the item counts against it until the block ends
+    if budget is None:
+        yield read(path)
+        return
+    with budget.hold(_size(path)):
+        yield read(path)
+
+
+def exif_segment(data):
+    # Walk the JPEG markers up to the image data and return the APP1 Exif payload
+    if not data or data[:2] != b"\xff\xd8":
+        return None
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker == 0xDA:  # start of scan, no more metadata
+            return None
+        length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        if marker == 0xE1 and data[pos + 4:pos + 10] == EXIF_HEADER:
+            segment = data[pos + 4:pos + 2 + length]
+            return segment if len(segment) == length - 2 else None
+        pos += 2 + length
+    return None
+
+
+def embedded_exif(data):
+    # The Exif block of any decodable format: APP1 for JPEG, the file itself for TIFF
+    fmt = decoders.sniff(data)
+    if fmt == "jpeg":
+        return exif_segment(data)
+    if fmt == "tiff":
+        return data
+    if fmt is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return img.info.get("exif")
+    except Exception:
+        return None
+
+
+def _jpeg_exif(f):
+    # Seeks from marker to marker so only the marker headers and the Exif block are read
+    if f.read(2) != b"\xff\xd8":
+        return None
+    while True:
+        header = f.read(4)
+        if len(header) < 4 or header[0] != 0xFF or header[1] == 0xDA:
+            return None
+        length = struct.unpack(">H", header[2:4])[0]
+        if header[1] == 0xE1:
+            payload = f.read(length - 2)
+            if payload.startswith(EXIF_HEADER):
+                return payload
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+def _png_exif(f):
+    # Chunk headers only, eXIf may come before or after the image data
+    f.seek(8)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        length, kind = struct.unpack(">I4s", header)
+        if kind == b"eXIf":
+            return f.read(length)
+        if kind == b"IEND":
+            return None
+        f.seek(length + 4, os.SEEK_CUR)  # data + CRC
+
+
+def _webp_exif(f):
+    # RIFF chunks, the EXIF chunk usually follows the image data
+    f.seek(12)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        kind, length = struct.unpack("<4sI", header)
+        if kind == b"EXIF":
+            return f.read(length)
+        f.seek(length + (length & 1), os.SEEK_CUR)  # chunks are padded to an even size
+
+
+def _heif_exif(f):
+    # The meta box at the start says where the Exif item is, only that item is read
+    location = raw_preview.heif_exif_location(f.read(RAW_HEADER_BYTES))
+    if location is None:
+        return None
+    f.seek(location[0])
+    item = f.read(location[1])
+    skip = struct.unpack(">I", item[:4])[0]  # offset of the TIFF header in the item
+    return item[4 + skip:]
+
+
+def read_exif_segment(path):
+    try:
+        with open(path, "rb") as f:
+            return _jpeg_exif(f)
+    except OSError as e:
+        print(f"Failed to read EXIF from {os.path.basename(path)}: {e}")
+        return None
+
+
+def read_exif_block(path):
+    # The Exif block of any decodable format without reading the image data
+    try:
+        with open(path, "rb") as f:
+            fmt = decoders.sniff(f.read(16))
+            f.seek(0)
+            if fmt == "jpeg":
+                return _jpeg_exif(f)
+            if fmt == "tiff":
+                # The IFDs are near the start, the strips / tiles after them
+                return f.read(RAW_HEADER_BYTES)
+            if fmt == "png":
+                return _png_exif(f)
+            if fmt == "webp":
+                return _webp_exif(f)
+            if fmt == "heic":
+                return _heif_exif(f)
+    except (OSError, struct.error) as e:
+        print(f"Failed to read EXIF from {os.path.basename(path)}: {e}")
+    return None
+
+
+def _stem(name):
+    return os.path.splitext(name)[0].lower()
+
+
+def list_captures(folder, extensions):
+    # One entry per shot: {primary file: [paired RAW and sidecars]}.
+    # The JPEG is preferred as the RAW's primary since it is smaller to read than the RAW.
+    by_stem = {}
+    sidecars = []
+    for name in os.listdir(folder):
+        lower = name.lower()
+        if lower.endswith(SIDECAR_EXTENSIONS):
+            sidecars.append(name)
+        elif lower.endswith(extensions) or raw_preview.is_raw(lower):
+            by_stem.setdefault(_stem(name), []).append(name)
+
+    # Only a RAW is paired with another file. Every other file, e.g. a TIFF or HEIC next to
+    # the JPEG, is an image in its own right and is culled on its own.
+    captures = {}
+    owners = {}  # stem -> capture that gets the RAW and the sidecars
+    for stem, names in by_stem.items():
+        raws = sorted(n for n in names if raw_preview.is_raw(n))
+        others = sorted((n for n in names if not raw_preview.is_raw(n)),
+                        key=lambda n: (not n.lower().endswith(decoders.EXTENSIONS["jpeg"]), n))
+        for name in others:
+            captures[name] = []
+        if others:
+            owners[stem] = others[0]
+            captures[others[0]].extend(raws)
+        else:
+            owners[stem] = raws[0]
+            captures[raws[0]] = raws[1:]
+
+    # Lightroom writes IMG_1.xmp, darktable IMG_1.CR3.xmp
+    for name in sidecars:
+        stem = _stem(name)
+        primary = owners.get(stem) or owners.get(_stem(stem))
+        if primary:
+            captures[primary].append(name)
+    return captures
+
+
+def copy_companions(folder, companions, dest_folder):
+    for name in companions:
+        shutil.copy(os.path.join(folder, name), os.path.join(dest_folder, name))
@@ -0,0 +1,264 @@
+import struct
+
+# TIFF based formats, Canon CR3 (ISO base media) and Fujifilm RAF
+RAW_EXTENSIONS = (".cr2", ".cr3", ".nef", ".nrw", ".arw", ".dng", ".orf", ".rw2", ".pef", ".raf")
+
+TIFF_MAGICS = {42, 0x4F52, 0x5352, 0x55}  # standard TIFF, Olympus (IIRO / IIRS), Panasonic RW2
+TIFF_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8, 13: 4}
+
+TAG_COMPRESSION = 259
+TAG_STRIP_OFFSETS = 273
+TAG_STRIP_BYTE_COUNTS = 279
+TAG_SUB_IFDS = 330
+TAG_JPEG_OFFSET = 513
+TAG_JPEG_LENGTH = 514
+
+CR3_CANON_UUID = bytes.fromhex("85c0b687820f11e08111f4ce462b6a48")
+CR3_PREVIEW_UUID = bytes.fromhex("eaf42b5e1c984b88b9fbb7dc406e4d16")
+RAF_MAGIC = b"FUJIFILMCCD-RAW "
+
+SOF_MARKERS = {0xC0, 0xC1, 0xC2}  # baseline / extended / progressive, not the lossless raw data (0xC3)
+
+
+def is_raw(name):
+    return name.lower().endswith(RAW_EXTENSIONS)
+
+
+def jpeg_dimensions(data):
+    # Walk the markers to the frame header, None if this is not a displayable JPEG
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    pos = 2
+    while pos + 9 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+            return width, height
+        if marker == 0xDA or (0xC3 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC)):
+            return None
+        pos += 2 + struct.unpack(">H", data[pos + 2:pos + 4])[0]
+    return None
+
+
+def _pick_largest(view, candidates):
+    best, best_area = None, 0
+    for offset, length in candidates:
+        if offset <= 0 or length <= 0 or offset + length > len(view):
+            continue
+        # Only the marker headers are walked, but APP1 maker notes + ICC can run past 64KB
+        dims = jpeg_dimensions(view[offset:offset + length])
+        if dims and dims[0] * dims[1] > best_area:
+            best, best_area = view[offset:offset + length], dims[0] * dims[1]
+    return best
+
+
+# TIFF (CR2, NEF, ARW, DNG, ORF, RW2, PEF)
+
+def _tiff_values(data, endian, kind, count, field):
+    size = TIFF_SIZES.get(kind, 1) * count
+    if size > 4:
+        field = struct.unpack(endian + "I", data[field:field + 4])[0]
+    if kind == 3:
+        return struct.unpack(f"{endian}{count}H", data[field:field + 2 * count])
+    if kind in (4, 13):
+        return struct.unpack(f"{endian}{count}I", data[field:field + 4 * count])
+    return ()
+
+
+def _tiff_previews(data):
+    endian = "<" if data[:2] == b"II" else ">"
+    candidates = []
+    queue = [struct.unpack(endian + "I", data[4:8])[0]]
+    seen = set()
+
+    while queue:
+        offset = queue.pop()
+        if offset in seen or offset < 8 or offset + 2 > len(data):
+            continue
+        seen.add(offset)
+
+        count = struct.unpack(endian + "H", data[offset:offset + 2])[0]
+        entries = {}
+        for i in range(count):
+            field = offset + 2 + i * 12
+            if field + 12 > len(data):
+                break
+            tag, kind, n = struct.unpack(endian + "HHI", data[field:field + 8])
+            try:
+                entries[tag] = _tiff_values(data, endian, kind, n, field + 8)
+            except struct.error:
+                continue  # value points past what we have
+
+        if TAG_JPEG_OFFSET in entries and TAG_JPEG_LENGTH in entries:
+            candidates.append((entries[TAG_JPEG_OFFSET][0], entries[TAG_JPEG_LENGTH][0]))
+        strips = entries.get(TAG_STRIP_OFFSETS, ())
+        if entries.get(TAG_COMPRESSION, (0,))[0] in (6, 7) and len(strips) == 1:
+            candidates.append((strips[0], entries.get(TAG_STRIP_BYTE_COUNTS, (0,))[0]))
+
+        queue.extend(entries.get(TAG_SUB_IFDS, ()))
+        next_field = offset + 2 + count * 12
+        if next_field + 4 <= len(data):
+            queue.append(struct.unpack(endian + "I", data[next_field:next_field + 4])[0])
+
+    return candidates
+
+
+# ISO base media (CR3)
+
+def _boxes(data, start, end):
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", data[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _child(data, start, end, kind):
+    for child_kind, child_start, child_end in _boxes(data, start, end):
+        if child_kind == kind:
+            return child_start, child_end
+    return None
+
+
+def _cr3_track_sample(data, trak):
+    # First sample of a track via stsz (size) and co64 / stco (offset)
+    box = trak
+    for kind in (b"mdia", b"minf", b"stbl"):
+        box = _child(data, box[0], box[1], kind)
+        if box is None:
+            return None
+    stsz = _child(data, box[0], box[1], b"stsz")
+    co64 = _child(data, box[0], box[1], b"co64")
+    stco = _child(data, box[0], box[1], b"stco")
+    if stsz is None or (co64 is None and stco is None):
+        return None
+    size, count = struct.unpack(">II", data[stsz[0] + 4:stsz[0] + 12])
+    if size == 0 and count:
+        size = struct.unpack(">I", data[stsz[0] + 12:stsz[0] + 16])[0]
+    if co64:
+        offset = struct.unpack(">Q", data[co64[0] + 8:co64[0] + 16])[0]
+    else:
+        offset = struct.unpack(">I", data[stco[0] + 8:stco[0] + 12])[0]
+    return offset, size
+
+
+def _cr3(data):
+    candidates, exif_blocks = [], []
+    for kind, start, end in _boxes(data, 0, len(data)):
+        if kind == b"moov":
+            for child, child_start, child_end in _boxes(data, start, end):
+                if child == b"uuid" and data[child_start:child_start + 16] == CR3_CANON_UUID:
+                    # CMT1 is IFD0 and CMT2 the Exif IFD, each stored as a small TIFF
+                    for meta, meta_start, meta_end in _boxes(data, child_start + 16, child_end):
+                        if meta in (b"CMT1", b"CMT2"):
+                            exif_blocks.append(bytes(data[meta_start:meta_end]))
+                elif child == b"trak" and not candidates:
+                    # The first track holds the full size JPEG
+                    sample = _cr3_track_sample(data, (child_start, child_end))
+                    if sample:
+                        candidates.append(sample)
+        elif kind == b"uuid" and data[start:start + 16] == CR3_PREVIEW_UUID:
+            # Smaller PRVW JPEG, only used when the full size one is missing
+            prvw = _child(data, start + 24, end, b"PRVW")
+            if prvw:
+                jpeg_start = bytes(data[prvw[0]:prvw[0] + 32]).find(b"\xff\xd8")
+                if jpeg_start >= 0:
+                    candidates.append((prvw[0] + jpeg_start, prvw[1] - prvw[0] - jpeg_start))
+    return candidates, exif_blocks
+
+
+def _uint(data, pos, size):
+    return int.from_bytes(data[pos:pos + size], "big") if size else 0
+
+
+def heif_exif_location(data):
+    # (file offset, length) of the Exif item of a HEIF / HEIC file, from the iinf and iloc boxes
+    try:
+        meta = _child(data, 0, len(data), b"meta")
+        if meta is None:
+            return None
+        start = meta[0] + 4  # version + flags
+        iinf = _child(data, start, meta[1], b"iinf")
+        iloc = _child(data, start, meta[1], b"iloc")
+        if iinf is None or iloc is None:
+            return None
+
+        exif_id = None
+        first_entry = iinf[0] + 4 + (2 if data[iinf[0]] == 0 else 4)
+        for kind, entry, _ in _boxes(data, first_entry, iinf[1]):
+            version = data[entry]
+            if kind != b"infe" or version < 2:
+                continue
+            id_size = 2 if version == 2 else 4
+            item_id = _uint(data, entry + 4, id_size)
+            if data[entry + 6 + id_size:entry + 10 + id_size] == b"Exif":
+                exif_id = item_id
+                break
+        if exif_id is None:
+            return None
+
+        pos = iloc[0]
+        version = data[pos]
+        offset_size, length_size = data[pos + 4] >> 4, data[pos + 4] & 15
+        base_size = data[pos + 5] >> 4
+        index_size = data[pos + 5] & 15 if version in (1, 2) else 0
+        id_size = 2 if version < 2 else 4
+        pos += 6
+        count = _uint(data, pos, id_size)
+        pos += id_size
+        for _ in range(count):
+            item_id = _uint(data, pos, id_size)
+            pos += id_size + (2 if version in (1, 2) else 0) + 2  # construction method, data reference
+            base = _uint(data, pos, base_size)
+            pos += base_size
+            extents = _uint(data, pos, 2)
+            pos += 2
+            location = None
+            for _ in range(extents):
+                pos += index_size
+                offset = _uint(data, pos, offset_size)
+                length = _uint(data, pos + offset_size, length_size)
+                pos += offset_size + length_size
+                location = location or (base + offset, length)
+            if item_id == exif_id:
+                return location
+    except (IndexError, struct.error):
+        pass  # meta box runs past what was read
+    return None
+
+
+def extract(data):
+    # Returns (preview JPEG as a memoryview of data, TIFF blocks to read EXIF from).
+    # Nothing is decoded or copied, only the container structure is walked.
+    view = memoryview(data)
+    try:
+        if data[:16] == RAF_MAGIC:
+            offset, length = struct.unpack(">II", data[84:92])
+            return _pick_largest(view, [(offset, length)]), []
+
+        if data[4:12] == b"ftypcrx ":
+            candidates, exif_blocks = _cr3(data)
+            return _pick_largest(view, candidates), exif_blocks
+
+        if data[:2] in (b"II", b"MM"):
+            endian = "<" if data[:2] == b"II" else ">"
+            if struct.unpack(endian + "H", data[2:4])[0] in TIFF_MAGICS:
+                # Standard TIFF headers can be read as EXIF directly, vendor magics can't
+                exif_blocks = [data] if data[2:4] in (b"*\x00", b"\x00*") else []
+                return _pick_largest(view, _tiff_previews(data)), exif_blocks
+    except struct.error:
+        pass  # truncated or not what the extension says
+    return None, []
@@ -0,0 +1,235 @@
+import os
+import json
+import math
+import time
+import multiprocessing
+
+# Thread pools of the native libraries we pull in (OpenMP, BLAS, torch intra-op)
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+
+PROFILE_PATH = os.environ.get(
+    "CULLER_SCHEDULE",
+    os.path.join(os.path.expanduser("~"), ".image_culler", "schedule.json")
+)
+
+
+def _read_first_line(path):
+    try:
+        with open(path, "r") as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_quota():
+    # cgroup v2: "max 100000" or "<quota> <period>"
+    line = _read_first_line("/sys/fs/cgroup/cpu.max")
+    if line:
+        quota, _, period = line.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+
+    # cgroup v1, quota of -1 means unlimited
+    for base in ("/sys/fs/cgroup/cpu", "/sys/fs/cgroup/cpu,cpuacct"):
+        quota = _read_first_line(os.path.join(base, "cpu.cfs_quota_us"))
+        period = _read_first_line(os.path.join(base, "cpu.cfs_period_us"))
+        if quota and period and int(quota) > 0:
+            return int(quota) / int(period)
+    return None
+
+
+def cpu_budget():
+    override = os.environ.get("CULLER_CPUS")
+    if override:
+        return max(1, int(override))
+
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # Windows / macOS
+        cpus = multiprocessing.cpu_count()
+
+    try:
+        quota = cgroup_cpu_quota()
+    except ValueError:
+        quota = None
+    if quota:
+        cpus = min(cpus, max(1, math.floor(quota)))
+    return cpus
+
+
+def load_profile(budget):
+    try:
+        with open(PROFILE_PATH, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # A profile tuned for another CPU budget does not apply here
+    if profile.get("budget") != budget:
+        return None
+    return profile
+
+
+def plan_schedule(budget=None, jobs=1, reserve=None, workers=None, cv_threads=None, detection_threads=None):
+    # Stages run one after the other, so each gets the whole budget. `jobs` is the
+    # number of culler processes sharing this machine (e.g. local shards).
+    budget = budget or cpu_budget()
+    budget = max(1, budget // max(1, jobs))
+
+    if reserve is None:
+        # Leave some room for the GUI / OS like the old cpu_count() - 2 did
+        reserve = 2 if budget > 4 else 0
+    usable = max(1, budget - reserve)
+
+    plan = {
+        "budget": budget,
+        "sharpness_workers": usable,
+        "cv_threads": 1,
+        "chunk_factor": 8,
+        "detection_threads": usable,
+        "source": "default",
+    }
+
+    profile = load_profile(budget)
+    if profile:
+        for key in ("sharpness_workers", "cv_threads", "detection_threads"):
+            if key in profile:
+                plan[key] = max(1, min(profile[key], usable))
+        plan["chunk_factor"] = profile.get("chunk_factor", plan["chunk_factor"])
+        plan["source"] = "autotune"
+
+    if workers:
+        plan["sharpness_workers"] = workers
+    if cv_threads:
+        plan["cv_threads"] = cv_threads
+    if detection_threads:
+        plan["detection_threads"] = detection_threads
+    if workers or cv_threads or detection_threads:
+        plan["source"] = "manual"
+
+    # Never let workers x library threads exceed the budget
+    plan["cv_threads"] = max(1, min(plan["cv_threads"], budget // plan["sharpness_workers"]))
+    return plan
+
+
+def chunk_size(total, workers, plan=None):
+    # A few chunks per worker balances uneven files, small chunks keep
+    # the IPC overhead per image low while still reacting to cancel quickly
+    factor = (plan or {}).get("chunk_factor", 8)
+    return max(1, min(64, total // (workers * factor)))
+
+
+def set_thread_env(count):
+    # Only read when a library initialises, so set it before spawning workers
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(count)
+
+
+def pin_threads(count, torch_threads=False):
+    set_thread_env(count)
+
+    try:
+        import cv2
+        cv2.setNumThreads(count)
+    except ImportError:
+        pass
+
+    if torch_threads:
+        try:
+            import torch
+            torch.set_num_threads(count)
+        except ImportError:
+            pass
+
+
+def init_worker(cv_threads):
+    pin_threads(cv_threads)
+
+
+def describe(plan):
+    return (f"CPU budget {plan['budget']}: {plan['sharpness_workers']} sharpness worker(s) x "
+            f"{plan['cv_threads']} OpenCV thread(s), {plan['detection_threads']} detection thread(s) "
+            f"[{plan['source']}]")
+
+
+def _time_sharpness(paths, workers, cv_threads, chunk_factor):
+    import decoders
+    from blur_sorter import compute_laplacian_variance, init_worker as init_sharpness_worker
+
+    plan = {"chunk_factor": chunk_factor}
+    set_thread_env(cv_threads)
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=init_sharpness_worker,
+                              initargs=(cv_threads, decoders.select_backends())) as pool:
+        pool.map(compute_laplacian_variance, paths, chunksize=chunk_size(len(paths), workers, plan))
+    return time.perf_counter() - start
+
+
+def _time_detection(paths, threads, mode):
+    import detection
+    import ingest
+
+    pin_threads(threads, torch_threads=True)
+    config = detection.MODES[mode]
+    model = detection.YOLO(config["model_path"])
+
+    def detect(path):
+        # Read and decode like a real run does, not through YOLO's own loader
+        model(ingest.read(path).decode(gray=False), imgsz=config["imgsz"], conf=config["conf"], verbose=False)
+
+    detect(paths[0])  # warm up
+    start = time.perf_counter()
+    for path in paths:
+        detect(path)
+    return time.perf_counter() - start
+
+
+def _candidates(budget):
+    counts = {budget, max(1, budget - 2), max(1, budget // 2), max(1, budget // 4)}
+    return sorted(counts, reverse=True)
+
+
+def autotune(paths, budget=None, detection_mode=None, detection_sample=8):
+    budget = budget or cpu_budget()
+    print(f"Autotuning on {len(paths)} image(s) with a CPU budget of {budget}...")
+
+    results = []
+    for workers in _candidates(budget):
+        for cv_threads in sorted({1, max(1, budget // workers)}):
+            for chunk_factor in (4, 8, 16):
+                elapsed = _time_sharpness(paths, workers, cv_threads, chunk_factor)
+                results.append((elapsed, workers, cv_threads, chunk_factor))
+                print(f"  {workers} worker(s) x {cv_threads} thread(s), chunk factor {chunk_factor}: "
+                      f"{len(paths) / elapsed:.1f} img/s")
+
+    _, workers, cv_threads, chunk_factor = min(results)
+    profile = {
+        "budget": budget,
+        "sharpness_workers": workers,
+        "cv_threads": cv_threads,
+        "chunk_factor": chunk_factor,
+        "detection_threads": budget,
+    }
+
+    if detection_mode:
+        sample = paths[:detection_sample]
+        timings = []
+        for threads in _candidates(budget):
+            elapsed = _time_detection(sample, threads, detection_mode)
+            timings.append((elapsed, threads))
+            print(f"  detection with {threads} thread(s): {len(sample) / elapsed:.1f} img/s")
+        profile["detection_threads"] = min(timings)[1]
+
+    os.makedirs(os.path.dirname(PROFILE_PATH), exist_ok=True)
+    with open(PROFILE_PATH, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    print(f"Best: {workers} worker(s) x {cv_threads} thread(s), chunk factor {chunk_factor}, "
+          f"{profile['detection_threads']} detection thread(s)")
+    print(f"Profile saved to {PROFILE_PATH}")
+    return profile
@@ -0,0 +1,148 @@
+import os
+import shutil
+from array import array
+from collections import defaultdict
+
+import numpy as np
+
+import ingest
+
+# How a row's keep decision is made
+JUDGED = 0  # score > base threshold + offset
+ALWAYS = 1  # kept whatever the threshold, e.g. burst picks with the Laplacian check off
+NEVER = 2  # not a candidate, e.g. below the best two of its burst
+RATED = 3  # kept for its star rating, never scored
+
+
+class ScoreTable:
+    # One row per scored image in flat typed arrays, so re-judging a whole shoot at another
+    # threshold is one vectorised compare instead of another pass over the files
+    def __init__(self, folder):
+        self.folder = folder
+        self.names = []
+        self.companions = []
+        self.rows = {}
+        self.scores = array("d")
+        self.base = array("d")  # ISO / aperture / shutter threshold, before base_blur and tolerance
+        self.states = array("b")
+        self.committed = array("b")  # 1 when the image is in Sharp/ as of the run or the last commit
+        self.bursts = array("i")  # index into burst_keys, -1 when the capture time is unknown
+        self.burst_keys = []
+        self._burst_ids = {}
+        self.offset = 0  # base_blur + tolerance that Sharp/ currently reflects
+
+    def __len__(self):
+        return len(self.names)
+
+    def _burst_id(self, key):
+        if key is None:
+            return -1
+        if key not in self._burst_ids:
+            self._burst_ids[key] = len(self.burst_keys)
+            self.burst_keys.append(key)
+        return self._burst_ids[key]
+
+    def add(self, name, score, base, state=JUDGED, kept=False, companions=(), burst=None):
+        # burst is the DateTimeOriginal the burst grouping uses
+        burst_id = self._burst_id(burst)
+        row = self.rows.get(name)
+        if row is None:
+            self.rows[name] = len(self.names)
+            self.names.append(name)
+            self.companions.append(list(companions))
+            self.scores.append(score or 0.0)
+            self.base.append(base or 0.0)
+            self.states.append(state)
+            self.committed.append(int(kept))
+            self.bursts.append(burst_id)
+            return
+        self.companions[row] = list(companions)
+        self.scores[row] = score or 0.0
+        self.base[row] = base or 0.0
+        self.states[row] = state
+        self.committed[row] = int(kept)
+        self.bursts[row] = burst_id
+
+    def _column(self, values, dtype):
+        # frombuffer shares the array's memory, keep the views local so the array can still grow
+        if not values:
+            return np.zeros(0, dtype)
+        return np.frombuffer(values, dtype)
+
+    def kept_mask(self, offset):
+        # Same comparison as ImageAnalyzer.judge: laplacian > threshold + base_blur + tolerance
+        states = self._column(self.states, np.int8)
+        judged = self._column(self.scores, np.float64) > self._column(self.base, np.float64) + offset
+        return (states == ALWAYS) | (states == RATED) | ((states == JUDGED) & judged)
+
+    def _borderline_first(self, mask, offset):
+        rows = np.flatnonzero(mask)
+        margin = np.abs(self._column(self.scores, np.float64)[rows] - self._column(self.base, np.float64)[rows] - offset)
+        return [self.names[i] for i in rows[np.argsort(margin, kind="stable")]]
+
+    def preview(self, offset):
+        kept = self.kept_mask(offset)
+        committed = self._column(self.committed, np.int8).astype(bool)
+        return {
+            "total": len(self),
+            "kept": int(kept.sum()),
+            "added": self._borderline_first(kept & ~committed, offset),
+            "removed": self._borderline_first(committed & ~kept, offset),
+        }
+
+    def groups(self):
+        # [(burst key or None, kept rows, rejected rows)] as Sharp/ is now: bursts in capture
+        # order, then every image that isn't part of one. Sharpest first within a group.
+        members = defaultdict(list)
+        for row, burst_id in enumerate(self.bursts):
+            members[burst_id].append(row)
+
+        groups, singles = [], []
+        for burst_id in sorted(members, key=lambda b: self.burst_keys[b] if b >= 0 else ""):
+            rows = members[burst_id]
+            if burst_id < 0 or len(rows) < 2:
+                singles.extend(rows)
+            else:
+                groups.append((self.burst_keys[burst_id], rows))
+        if singles:
+            groups.append((None, singles))
+
+        result = []
+        for key, rows in groups:
+            rows.sort(key=lambda r: (-self.scores[r], self.names[r]))
+            result.append((key, [r for r in rows if self.committed[r]], [r for r in rows if not self.committed[r]]))
+        return result
+
+    def sync(self, output_folder=None):
+        # What the preview compares against is what is in Sharp/, not what the run meant to write
+        output_folder = output_folder or os.path.join(self.folder, "Sharp")
+        try:
+            present = set(os.listdir(output_folder))
+        except OSError:
+            present = set()
+        self.committed = array("b", (name in present for name in self.names))
+
+    def commit(self, offset, output_folder=None):
+        # Only the difference to what is in Sharp/ now is copied or removed. Files the
+        # table doesn't know about (e.g. from another run) are left alone.
+        output_folder = output_folder or os.path.join(self.folder, "Sharp")
+        os.makedirs(output_folder, exist_ok=True)
+        present = set(os.listdir(output_folder))
+        kept = self.kept_mask(offset)
+
+        copied, removed = [], []
+        for row, name in enumerate(self.names):
+            if kept[row] and name not in present:
+                shutil.copy(os.path.join(self.folder, name), os.path.join(output_folder, name))
+                ingest.copy_companions(self.folder, self.companions[row], output_folder)
+                copied.append(name)
+            elif not kept[row] and name in present:
+                # Only the copies in Sharp/ are removed, the originals stay in the folder
+                for stale in [name] + self.companions[row]:
+                    if stale in present:
+                        os.remove(os.path.join(output_folder, stale))
+                removed.append(name)
+
+        self.committed = array("b", kept.astype(np.int8).tobytes())
+        self.offset = offset
+        return {"copied": copied, "removed": removed}
@@ -0,0 +1,90 @@
+import os
+import json
+import hashlib
+
+
+def parse_shard(spec):
+    # "i/n" -> (i, n), e.g. "0/4" is the first of four shards
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Shard must look like 'index/count', got {spec!r}")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Shard index must be in [0, {count}), got {index}")
+    return index, count
+
+
+def shard_of(key, count):
+    # Stable across processes, machines and Python versions (unlike hash())
+    digest = hashlib.sha1(str(key).encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) % count
+
+
+def in_shard(key, shard):
+    if shard is None:
+        return True
+    index, count = shard
+    return shard_of(key, count) == index
+
+
+def filter_names(names, shard):
+    # Shard by file name only so shards agree no matter where the storage is mounted
+    return [n for n in names if in_shard(os.path.basename(n), shard)]
+
+
+def write_manifest(path, manifest):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def merge_manifests(manifests):
+    if not manifests:
+        raise ValueError("No manifests to merge")
+
+    counts = {m["shard"][1] for m in manifests}
+    if len(counts) != 1:
+        raise ValueError(f"Manifests come from different shard counts: {sorted(counts)}")
+    count = counts.pop()
+
+    seen = [m["shard"][0] for m in manifests]
+    duplicates = sorted({i for i in seen if seen.count(i) > 1})
+    if duplicates:
+        raise ValueError(f"Shard(s) {duplicates} appear more than once")
+
+    merged = {
+        "folder": manifests[0]["folder"],
+        "shard_count": count,
+        "shards": sorted(seen),
+        "missing_shards": sorted(set(range(count)) - set(seen)),
+        "elapsed": max(m.get("elapsed", 0.0) for m in manifests),
+        "shard_seconds": sum(m.get("elapsed", 0.0) for m in manifests),  # wall time of every shard added up
+        "sharpness": {"kept": [], "rejected": [], "scores": {}, "bursts": 0},
+        "detection": {"processed": 0, "routed": {}},
+        "decoders": {},
+    }
+
+    for m in sorted(manifests, key=lambda m: m["shard"][0]):
+        sharpness = m.get("sharpness") or {}
+        merged["sharpness"]["kept"].extend(sharpness.get("kept", []))
+        merged["sharpness"]["rejected"].extend(sharpness.get("rejected", []))
+        merged["sharpness"]["scores"].update(sharpness.get("scores", {}))
+        merged["sharpness"]["bursts"] += sharpness.get("bursts", 0)
+
+        detection = m.get("detection") or {}
+        merged["detection"]["processed"] += detection.get("processed", 0)
+        merged["detection"]["routed"].update(detection.get("routed", {}))
+
+        # Shards may run on different machines, so each keeps its own backend choice
+        merged["decoders"][str(m["shard"][0])] = m.get("decoders")
+
+    merged["sharpness"]["kept"].sort()
+    merged["sharpness"]["rejected"].sort()
+    return merged
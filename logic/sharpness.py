@@ -0,0 +1,99 @@
+import cv2
+import numpy as np
+
+# "crop" is the original center-crop variance the ISO thresholds were tuned on
+STRATEGIES = ("crop", "max", "topk", "center")
+DEFAULT_GRID = (6, 6)  # tile edges fall on the rule-of-thirds lines
+
+
+def parse_grid(spec):
+    # "6x6" -> (6, 6)
+    try:
+        rows, cols = (int(part) for part in spec.lower().split("x"))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Grid must look like 'ROWSxCOLS', got {spec!r}")
+    if rows < 1 or cols < 1:
+        raise ValueError(f"Grid must have at least one row and column, got {spec!r}")
+    return rows, cols
+
+
+def crop_center(image, fraction=0.5):
+    h, w = image.shape[:2]
+    ch, cw = int(h * fraction), int(w * fraction)
+    y, x = (h - ch) // 2, (w - cw) // 2
+    return image[y:y+ch, x:x+cw]
+
+
+def laplacian(image):
+    # Laplacian of 8-bit input is integral and small, float32 holds it exactly at half the memory of CV_64F
+    return cv2.Laplacian(image, cv2.CV_32F)
+
+
+def variance(image):
+    # meanStdDev accumulates in double without allocating a temporary image
+    _, stddev = cv2.meanStdDev(laplacian(image))
+    return float(stddev[0, 0]) ** 2
+
+
+def tile_variances(image, grid=DEFAULT_GRID):
+    rows, cols = grid
+    lap = laplacian(image)
+    h, w = lap.shape[:2]
+    th, tw = h // rows, w // cols
+    if th == 0 or tw == 0:
+        return np.array([[variance(image)]])
+
+    # Splitting both axes is a view, the few remainder pixels past the last full tile are ignored
+    blocks = lap[:th * rows, :tw * cols].reshape(rows, th, cols, tw)
+    count = th * tw
+    means = blocks.sum(axis=(1, 3), dtype=np.float64) / count
+    np.multiply(blocks, blocks, out=blocks)  # square in place, squares of |lap| <= 1020 stay exact in float32
+    mean_squares = blocks.sum(axis=(1, 3), dtype=np.float64) / count
+    return np.maximum(mean_squares - means * means, 0.0)
+
+
+def center_weights(grid, sigma=0.5):
+    rows, cols = grid
+    # Tile centers in [-1, 1], gaussian falloff keeps the thirds intersections well weighted
+    y = (np.arange(rows) + 0.5) / rows * 2 - 1
+    x = (np.arange(cols) + 0.5) / cols * 2 - 1
+    weights = np.exp(-(y[:, None] ** 2 + x[None, :] ** 2) / (2 * sigma ** 2))
+    return weights / weights.sum()
+
+
+def aggregate(tiles, strategy, top_k=None):
+    if strategy == "max":
+        return float(tiles.max())
+    if strategy == "topk":
+        flat = tiles.ravel()
+        k = min(flat.size, top_k or max(1, flat.size // 9))
+        return float(np.partition(flat, flat.size - k)[-k:].mean())
+    if strategy == "center":
+        return float((tiles * center_weights(tiles.shape)).sum())
+    raise ValueError(f"Unknown sharpness strategy: {strategy!r}")
+
+
+def subject_variance(image, boxes, min_size=16):
+    h, w = image.shape[:2]
+    total = 0.0
+    area = 0
+    for x1, y1, x2, y2 in boxes:
+        x1, x2 = max(0, x1), min(w, x2)
+        y1, y2 = max(0, y1), min(h, y2)
+        if x2 - x1 < min_size or y2 - y1 < min_size:
+            continue
+        # Area weighted so the main subject counts more than a small ball in the corner
+        box_area = (x2 - x1) * (y2 - y1)
+        total += variance(image[y1:y2, x1:x2]) * box_area
+        area += box_area
+    return total / area if area else None
+
+
+def score(image, strategy="crop", grid=DEFAULT_GRID, top_k=None, boxes=None):
+    if boxes:
+        subject = subject_variance(image, boxes)
+        if subject is not None:
+            return subject
+    if strategy == "crop":
+        return variance(crop_center(image))
+    return aggregate(tile_variances(image, grid), strategy, top_k)
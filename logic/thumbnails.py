@@ -0,0 +1,163 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import cv2
+from PIL import Image
+
+import ingest
+import decoders
+import raw_preview
+
+THUMB_SIZE = 160  # longest edge, the size of a standard EXIF thumbnail
+JPEG_QUALITY = 85
+DEFAULT_MEMORY = 32 * 1024 * 1024  # bytes of encoded thumbnails kept in memory
+
+CACHE_DIR = os.environ.get(
+    "CULLER_THUMBNAILS",
+    os.path.join(os.path.expanduser("~"), ".image_culler", "thumbnails")
+)
+
+ORIENTATION_TAG = 0x0112
+
+
+def _orientation(blocks):
+    for block in blocks:
+        if not block:
+            continue
+        try:
+            exif = Image.Exif()
+            exif.load(bytes(block))
+            return exif.get(ORIENTATION_TAG, 1)
+        except Exception:
+            continue
+    return 1
+
+
+def embedded_jpeg(path):
+    # The smallest JPEG already in the file: the IFD1 thumbnail of a JPEG's Exif block, or
+    # whichever preview of a RAW sits in its first RAW_HEADER_BYTES. Only that much is read.
+    if raw_preview.is_raw(path):
+        preview, blocks = raw_preview.extract(ingest.read_head(path))
+        return preview, _orientation(blocks)
+
+    segment = ingest.read_exif_segment(path)
+    if not segment:
+        return None, 1
+    tiff = segment[len(ingest.EXIF_HEADER):]
+    # IFD1 is chained after IFD0 and holds its thumbnail in JPEGInterchangeFormat(Length)
+    thumbnail, _ = raw_preview.extract(tiff)
+    return thumbnail, _orientation([segment])
+
+
+def _scale_for(data, size):
+    # Largest 1/2, 1/4, 1/8 reduction that still leaves at least `size` pixels on the long edge
+    dims = raw_preview.jpeg_dimensions(data)
+    if not dims:
+        return 1
+    for scale in (8, 4, 2):
+        if max(dims) // scale >= size:
+            return scale
+    return 1
+
+
+def _fit(image, size):
+    h, w = image.shape[:2]
+    ratio = size / max(h, w)
+    if ratio >= 1:
+        return image
+    return cv2.resize(image, (max(1, round(w * ratio)), max(1, round(h * ratio))), interpolation=cv2.INTER_AREA)
+
+
+def make_thumbnail(path, size=THUMB_SIZE):
+    # Never a full size decode: the embedded thumbnail / preview first, else a reduced-scale decode
+    image = None
+    jpeg, orientation = embedded_jpeg(path)
+    if jpeg is not None:
+        image = decoders.decode(jpeg, gray=False, scale=_scale_for(jpeg, size))
+        # Embedded thumbnails rarely carry their own Exif, the orientation is the parent's
+        if image is not None and ingest.exif_segment(jpeg) is None:
+            image = decoders.apply_orientation(image, orientation)
+
+    if image is None:
+        item = ingest.read(path)
+        data = item.image_data
+        if data is not None:
+            image = decoders.decode(data, gray=False, scale=_scale_for(data, size))
+        item.release()
+
+    if image is None:
+        return None
+    ok, encoded = cv2.imencode(".jpg", _fit(image, size), [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    return encoded.tobytes() if ok else None
+
+
+class ThumbnailCache:
+    # Encoded JPEG thumbnails in an LRU bounded by bytes, backed by a store on disk keyed
+    # by path, size and mtime so an edited file gets a new thumbnail
+    def __init__(self, cache_dir=CACHE_DIR, memory_budget=DEFAULT_MEMORY, size=THUMB_SIZE):
+        self.cache_dir = cache_dir
+        self.memory_budget = memory_budget
+        self.size = size
+        self.memory = OrderedDict()
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def _key(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        ident = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{self.size}"
+        return hashlib.sha1(ident.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key):
+        # Two character fan-out keeps each directory small for 20k+ thumbnails
+        return os.path.join(self.cache_dir, key[:2], key + ".jpg")
+
+    def _remember(self, key, data):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return
+            self.memory[key] = data
+            self.used += len(data)
+            while self.used > self.memory_budget and len(self.memory) > 1:
+                _, dropped = self.memory.popitem(last=False)
+                self.used -= len(dropped)
+
+    def get(self, path):
+        # Thread safe, so thumbnails can be made on a pool while the GUI scrolls
+        key = self._key(path)
+        if key is None:
+            return None
+
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                return data
+
+        disk_path = self._disk_path(key)
+        try:
+            with open(disk_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            data = make_thumbnail(path, self.size)
+            if data is None:
+                return None
+            self._store(disk_path, data)
+
+        self._remember(key, data)
+        return data
+
+    def _store(self, disk_path, data):
+        try:
+            os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+            tmp_path = f"{disk_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, disk_path)
+        except OSError as e:
+            print(f"Could not store thumbnail: {e}")